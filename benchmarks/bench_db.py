@@ -0,0 +1,123 @@
+"""Connect-per-call SQLite access versus the pooled access layer.
+
+Measures single-row insert throughput (one thread and several concurrent
+writers) and the queries behind one Reporting page render, against a
+throwaway database. Run from the repository root:
+
+    python benchmarks/bench_db.py [--rows 5000] [--threads 8]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROW = ("bench.jpg", "0" * 32, "LIKELY GENUINE", 0.42, None, "{}", "{}")
+
+
+def legacy_insert(path):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO scans (filename, file_hash, scan_result, confidence_score, timestamp, metadata, detector_results)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', ROW[:4] + (datetime.now(),) + ROW[5:])
+    conn.commit()
+    conn.close()
+
+
+def legacy_render(path):
+    import pandas as pd
+
+    conn = sqlite3.connect(path)
+    pd.read_sql_query("SELECT id, filename, scan_result FROM scans WHERE flagged = FALSE", conn)
+    conn.close()
+    conn = sqlite3.connect(path)
+    pd.read_sql_query("SELECT * FROM scans WHERE flagged = TRUE", conn)
+    conn.close()
+
+
+def pooled_insert(db):
+    db.insert_scans([ROW[:4] + (datetime.now(),) + ROW[5:]])
+
+
+def pooled_render(db):
+    db.scans_page(False)
+    db.scans_page(True)
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return count / (time.perf_counter() - start)
+
+
+def concurrent_rate(fn, threads, per_thread):
+    errors = []
+
+    def worker():
+        for _ in range(per_thread):
+            try:
+                fn()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return threads * per_thread / (time.perf_counter() - start), len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000, help="rows seeded before measuring page renders")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent writers")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        os.environ["POWERHEX_DB"] = os.path.join(tmp, "pooled.db")
+        import powerhex_db as db
+
+        db.init_database()
+        # Same schema, default rollback journal, as the app used to run it
+        source = sqlite3.connect(db.DB_PATH)
+        legacy = sqlite3.connect(legacy_path)
+        for (sql,) in source.execute("SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"):
+            legacy.execute(sql)
+        legacy.commit()
+        legacy.close()
+        source.close()
+
+        print(f"{'benchmark':<34} {'connect-per-call':>17} {'pooled':>10}")
+        print(f"{'inserts/s (1 thread)':<34} {rate(lambda: legacy_insert(legacy_path), 500):>17.0f} "
+              f"{rate(lambda: pooled_insert(db), 500):>10.0f}")
+
+        legacy_rate, legacy_errors = concurrent_rate(lambda: legacy_insert(legacy_path), args.threads, 200)
+        pooled_rate, pooled_errors = concurrent_rate(lambda: pooled_insert(db), args.threads, 200)
+        print(f"{f'inserts/s ({args.threads} threads)':<34} {legacy_rate:>17.0f} {pooled_rate:>10.0f}")
+        print(f"{'lock errors':<34} {legacy_errors:>17} {pooled_errors:>10}")
+
+        rows = [ROW[:4] + (datetime.now(),) + ROW[5:]] * args.rows
+        with sqlite3.connect(legacy_path) as conn:
+            conn.executemany('''
+                INSERT INTO scans (filename, file_hash, scan_result, confidence_score, timestamp, metadata, detector_results)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        db.insert_scans(rows)
+        print(f"{'reporting renders/s':<34} {rate(lambda: legacy_render(legacy_path), 50):>17.1f} "
+              f"{rate(lambda: pooled_render(db), 50):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Per-scan CPU time and peak memory of the upload hashing path.
+
+Compares the old ingest (decode, re-encode to PNG, MD5 the PNG) with hashing
+the original upload bytes. Run from the repository root:
+
+    python benchmarks/bench_ingest.py [megapixels ...]
+"""
+import hashlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from powerhex_cache import content_hash
+
+
+def make_jpeg(megapixels):
+    """A noisy synthetic photo, so the PNG is as large as a real one would be"""
+    side = int((megapixels * 1_000_000) ** 0.5)
+    image = Image.effect_noise((side, side), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def png_md5_path(data):
+    image = Image.open(io.BytesIO(data))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return hashlib.md5(buffer.getvalue()).hexdigest()
+
+
+def raw_hash_path(data):
+    return content_hash(memoryview(data))
+
+
+def measure(fn, data, repeat=3):
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(data)
+        cpu.append(time.process_time() - start)
+
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(cpu), peak
+
+
+def main(sizes):
+    print(f"{'MP':>4} {'JPEG MB':>8} {'PNG+MD5 ms':>11} {'PNG+MD5 MB':>11} {'raw ms':>7} {'raw MB':>7}")
+    for megapixels in sizes:
+        data = make_jpeg(megapixels)
+        old_cpu, old_peak = measure(png_md5_path, data)
+        new_cpu, new_peak = measure(raw_hash_path, data)
+        print(f"{megapixels:>4g} {len(data) / 1e6:>8.1f} {old_cpu * 1000:>11.0f} {old_peak / 1e6:>11.1f} "
+              f"{new_cpu * 1000:>7.1f} {new_peak / 1e6:>7.2f}")
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [2, 12, 48])
@@ -0,0 +1,91 @@
+"""Peak RSS of preparing one upload for display and analysis.
+
+Compares decoding the full image (as the scanner page used to, for
+st.image, metadata and pHash) with the header-only, downscaled ingest.
+Each measurement runs in a fresh process and reports the growth of peak
+RSS over an already-warmed process, so peaks do not carry over.
+Run from the repository root:
+
+    python benchmarks/bench_preview.py [megapixels ...]
+"""
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+
+def make_jpeg(megapixels):
+    """A smooth synthetic picture that compresses like a photo"""
+    side = int((megapixels * 1_000_000) ** 0.5)
+    image = Image.effect_mandelbrot((side, side), (-2.0, -1.5, 1.0, 1.5), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def full_decode(data):
+    from powerhex_pipeline import extract_metadata
+    from powerhex_phash import phash
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    extract_metadata(image)
+    phash(image)
+
+
+def downscaled(data):
+    from powerhex_ingest import open_image
+    from powerhex_pipeline import extract_metadata
+    from powerhex_phash import phash
+
+    upload = open_image(data)
+    extract_metadata(upload.header)
+    upload.preview()
+    phash(upload.analysis_copy())
+
+
+def child(name, path, queue):
+    with open(path, "rb") as f:
+        data = f.read()
+    fn = {"full": full_decode, "downscaled": downscaled}[name]
+    # Import everything first so only the ingest itself raises the peak
+    downscaled(make_jpeg(0.01))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    fn(data)
+    elapsed = time.perf_counter() - start
+    queue.put(((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024, elapsed))
+
+
+def measure(name, path):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=child, args=(name, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(sizes):
+    print(f"{'MP':>4} {'full MB':>8} {'full ms':>8} {'downscaled MB':>14} {'downscaled ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            path = os.path.join(tmp, "upload.jpg")
+            with open(path, "wb") as f:
+                f.write(make_jpeg(megapixels))
+            full_mb, full_s = measure("full", path)
+            small_mb, small_s = measure("downscaled", path)
+            print(f"{megapixels:>4g} {full_mb:>8.0f} {full_s * 1000:>8.0f} {small_mb:>14.0f} {small_s * 1000:>14.0f}")
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [2, 12, 48])
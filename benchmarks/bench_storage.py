@@ -0,0 +1,190 @@
+"""SQLite versus PostgreSQL behind the same storage functions.
+
+Runs one seeded workload through powerhex_db against each backend, checks
+that scans, reports, metadata search, quiz stats, jobs and retention give
+the same results, and times bulk inserts, concurrent writers, folding
+the change log into the dashboard snapshots and a Reporting page render.
+
+PostgreSQL runs in a throwaway database created on --postgres-url and
+dropped afterwards; without it an ephemeral local server is started with
+pgserver (``pip install pgserver "psycopg[binary,pool]"``). Run from the
+repository root:
+
+    python benchmarks/bench_storage.py [--scans 20000] [--threads 8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS = ("LIKELY GENUINE", "SUSPICIOUS", "LIKELY FAKE", "INCONCLUSIVE")
+CAMERAS = ("Canon", "Nikon", "Apple", "Sony")
+BATCH = 100
+START = datetime(2025, 1, 1)
+
+
+def synthetic_batch(rng, count):
+    """Scan rows, tag dicts and pHashes for insert_scans"""
+    rows, tags, phashes = [], [], []
+    for _ in range(count):
+        result = rng.choice(RESULTS)
+        confidence = None if result == "INCONCLUSIVE" else round(rng.random(), 6)
+        detectors = {"deepware": {"is_fake": bool(confidence and confidence > 0.6), "confidence": confidence,
+                                  "api_name": "Deepware API", "details": {"frames": 1}, "latency_ms": 12.5},
+                     "reverse_search": []}
+        rows.append((f"scan-{rng.getrandbits(32):08x}.jpg", f"{rng.getrandbits(128):032x}", result, confidence,
+                     START + timedelta(seconds=rng.randrange(200 * 86400)), None, json.dumps(detectors)))
+        tags.append({"Make": rng.choice(CAMERAS), "ISOSpeedRatings": rng.choice((100, 400, 1600)),
+                     "ExposureTime": rng.choice((0.004, 0.01, 0.5))})
+        phashes.append(rng.getrandbits(64) - (1 << 63))
+    return rows, tags, phashes
+
+
+def workload(scans, threads, seed):
+    """Run the workload against the configured backend; returns (results to compare, timings)"""
+    import powerhex_db as db
+    from powerhex_rollup import run_rollup
+
+    db.init_database()
+    rng = random.Random(seed)
+    timings = {}
+
+    batches = [synthetic_batch(rng, BATCH) for _ in range(scans // BATCH)]
+    start = time.perf_counter()
+    for rows, tags, phashes in batches:
+        db.insert_scans(rows, phashes=phashes, metadata=tags)
+    timings["bulk inserts/s"] = scans / (time.perf_counter() - start)
+
+    singles = [synthetic_batch(rng, 1) for _ in range(threads * 50)]
+
+    def writer(index):
+        for rows, tags, phashes in singles[index::threads]:
+            db.insert_scans(rows, phashes=phashes, metadata=tags)
+
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    timings[f"inserts/s ({threads} threads)"] = len(singles) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    applied = run_rollup()
+    timings["rollup changes/s"] = applied / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(20):
+        db.scans_page(False)
+        db.scans_page(True)
+        db.analytics_summary()
+    timings["reporting renders/s"] = 20 / (time.perf_counter() - start)
+
+    # Reports: flag every 10th scan by file hash order, resolve a filtered subset
+    page = db.read_frame("SELECT id FROM scans ORDER BY file_hash")
+    flagged = db.flag_scans([int(scan_id) for scan_id in page["id"][::10]], "Misinformation: bench")
+    resolved = db.resolve_matching_reports(result="SUSPICIOUS", date_to=date(2025, 2, 1))
+    db.insert_quiz_result(80, START)
+    db.insert_quiz_result(60, START + timedelta(days=1))
+
+    job_id = db.enqueue_job("job.jpg", b"\xff\xd8 image bytes")
+    claimed = db.claim_next_job("bench")
+    db.finish_job(job_id, "bench", result="{}")
+
+    def records(frame):
+        return json.loads(frame.round(6).to_json(orient="records"))
+
+    run_rollup()
+    results = {
+        "summary": {key: round(value, 6) for key, value in db.analytics_summary().items()},
+        "distribution": records(db.result_distribution().sort_values("scan_result")),
+        "histogram": records(db.confidence_histogram()),
+        "daily": records(db.daily_activity()),
+        "flagged": [flagged, resolved, sorted(db.scans_page(True, limit=100_000)["filename"])[:20]],
+        "metadata_keys": records(db.metadata_keys()),
+        "metadata_counts": records(db.metadata_value_counts("Make")),
+        "search_equals": len(db.search_metadata([("Make", "equals", "Canon")], limit=100_000)),
+        "search_numeric": len(db.search_metadata([("ISOSpeedRatings", "greater than", "200"),
+                                                  ("ExposureTime", "less than", "0.1")], limit=100_000)),
+        "history": len(db.scans_between(date(2025, 3, 1), date(2025, 3, 31))),
+        "job": [claimed[1], bytes(claimed[2]).hex(), db.job_queue_depth()],
+        "compacted": db.compact_scans(START + timedelta(days=30), 100_000),
+        "compacted_detectors": json.loads(db.read_frame(
+            "SELECT detector_results FROM scans WHERE compacted = TRUE ORDER BY file_hash LIMIT 1"
+        )["detector_results"][0]),
+        "metadata_after_compaction": int(db.read_frame("SELECT COUNT(*) AS n FROM scan_metadata")["n"][0])
+    }
+    quiz = db.archive_candidates("educational_stats", START + timedelta(hours=12), 10)
+    results["archived_quiz"] = [row["score"] for row in quiz]
+    results["deleted_quiz"] = db.delete_archived("educational_stats", [row["id"] for row in quiz])
+    results["quiz_left"] = int(db.read_frame("SELECT COUNT(*) AS n FROM educational_stats")["n"][0])
+    return results, timings
+
+
+def in_process(env, fn, *args):
+    """Run fn in a fresh interpreter with the given POWERHEX_* environment"""
+    os.environ.update(env)
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def postgres_server(tmp):
+    """URL of an ephemeral local PostgreSQL server"""
+    import pgserver
+
+    return pgserver.get_server(os.path.join(tmp, "pgdata"), cleanup_mode="stop").get_uri()
+
+
+def with_database(url, name):
+    """url with its database name replaced"""
+    base, _, query = url.partition("?")
+    return base.rsplit("/", 1)[0] + "/" + name + ("?" + query if query else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scans", type=int, default=20_000, help="scans bulk inserted before the checks")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent single-scan writers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--postgres-url", help="server to create the throwaway database on")
+    args = parser.parse_args()
+
+    import psycopg
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server_url = args.postgres_url or postgres_server(tmp)
+        database = f"powerhex_bench_{os.getpid()}"
+        with psycopg.connect(server_url, autocommit=True) as admin:
+            admin.execute(f"CREATE DATABASE {database}")
+        try:
+            sqlite = in_process({"POWERHEX_DB": os.path.join(tmp, "bench.db"), "POWERHEX_DATABASE_URL": ""},
+                                workload, args.scans, args.threads, args.seed)
+            postgres = in_process({"POWERHEX_DATABASE_URL": with_database(server_url, database)},
+                                  workload, args.scans, args.threads, args.seed)
+        finally:
+            with psycopg.connect(server_url, autocommit=True) as admin:
+                admin.execute(f"DROP DATABASE IF EXISTS {database} WITH (FORCE)")
+
+    print(f"{'benchmark':<34} {'sqlite':>10} {'postgresql':>12}")
+    for name, value in sqlite[1].items():
+        print(f"{name:<34} {value:>10.0f} {postgres[1][name]:>12.0f}")
+
+    mismatches = [key for key in sqlite[0] if sqlite[0][key] != postgres[0][key]]
+    for key in mismatches:
+        print(f"MISMATCH {key}:\n  sqlite     {sqlite[0][key]}\n  postgresql {postgres[0][key]}")
+    print("results match" if not mismatches else f"{len(mismatches)} results differ")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
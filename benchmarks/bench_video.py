@@ -0,0 +1,125 @@
+"""Frame sampling cost and peak memory against clip length.
+
+Encodes seeded synthetic clips (H.264 MP4 and animated GIF) and, each in a
+fresh process, runs the sampler the clip scan uses (decode, scale, pHash,
+dedupe) next to decoding every frame into a list. Sampling should keep
+its decode count and memory flat as the clip grows; keeping every frame
+grows with it. Needs PyAV. Run from the repository root:
+
+    python benchmarks/bench_video.py [seconds ...] [--all-frames-max 30]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FPS = 25
+SIZE = (1280, 720)
+GIF_SIZE = (640, 480)
+
+
+def moving_frames(seconds, size, fps, seed):
+    """Seeded frames of shapes drifting over a gradient, with a scene cut every 4 seconds"""
+    import numpy as np
+
+    rng = random.Random(seed)
+    width, height = size
+    x = np.linspace(0, 1, width)[None, :]
+    y = np.linspace(0, 1, height)[:, None]
+    for index in range(int(seconds * fps)):
+        if index % (4 * fps) == 0:
+            base = rng.random(), rng.random(), rng.random()
+            shapes = [(rng.random(), rng.random(), rng.uniform(0.05, 0.2), rng.uniform(-0.01, 0.01)) for _ in range(6)]
+        frame = np.empty((height, width, 3))
+        for channel, value in enumerate(base):
+            frame[..., channel] = value * x + (1 - value) * y
+        for cx, cy, radius, speed in shapes:
+            cx = (cx + speed * index) % 1
+            frame[(x - cx) ** 2 + (y - cy) ** 2 < radius ** 2] = (cx, cy, radius * 4)
+        yield (frame * 255).astype(np.uint8)
+
+
+def make_mp4(seconds, seed=0):
+    import av
+
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="mp4") as container:
+        stream = container.add_stream("libx264" if "libx264" in av.codecs_available else "mpeg4", rate=FPS)
+        stream.width, stream.height = SIZE
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = 2 * FPS
+        stream.options = {"preset": "ultrafast"}
+        for array in moving_frames(seconds, SIZE, FPS, seed):
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(array, format="rgb24")))
+        container.mux(stream.encode())
+    return buffer.getvalue()
+
+
+def make_gif(seconds, seed=0):
+    from PIL import Image
+
+    fps = 10
+    frames = [Image.fromarray(array) for array in moving_frames(seconds, GIF_SIZE, fps, seed)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=1000 // fps, loop=0)
+    return buffer.getvalue()
+
+
+def peak_rss_mb():
+    """High-water RSS of this process; unlike ru_maxrss it does not start at the parent's (Linux only)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def measure(data, mode):
+    """(frames decoded, frames kept, seconds, peak RSS growth in MB) for one clip in this process"""
+    from powerhex_video import open_media, sample_frames
+
+    clip = open_media(data)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "sampled":
+        stats = {}
+        kept = sum(1 for _ in sample_frames(clip, stats=stats))
+        decoded = stats["decoded"]
+    else:
+        frames = [load() for _, _, load in clip.frames()]
+        decoded = kept = len(frames)
+    return decoded, kept, time.perf_counter() - start, peak_rss_mb() - baseline
+
+
+def in_process(data, mode):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(measure, data, mode).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("seconds", nargs="*", type=float, default=[10, 60, 300])
+    parser.add_argument("--all-frames-max", type=float, default=30,
+                        help="longest clip to also decode in full (memory grows with every frame)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'clip':<14} {'MB':>6} {'mode':<8} {'decoded':>8} {'kept':>5} {'seconds':>8} {'peak MB':>8}")
+    for seconds in args.seconds:
+        for kind, make in (("mp4", make_mp4), ("gif", make_gif)):
+            data = make(seconds, args.seed)
+            modes = ["sampled"] + (["all"] if seconds <= args.all_frames_max else [])
+            for mode in modes:
+                decoded, kept, elapsed, peak = in_process(data, mode)
+                print(f"{kind + f' {seconds:g}s':<14} {len(data) / 1e6:>6.1f} {mode:<8} {decoded:>8} {kept:>5} "
+                      f"{elapsed:>8.2f} {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Load test for the HTTP API against the mock detectors.
+
+Starts the API in-process on a throwaway database (or targets --url) and
+fires scans from many concurrent clients, each upload a distinct synthetic
+image so the result cache does not answer them. Reports throughput,
+latency percentiles, and how many requests admission control turned away
+(503/429) and how fast. Run from the repository root:
+
+    python benchmarks/load_api.py [--clients 32] [--requests 200] [--endpoint scan|stream]
+
+The mock detectors sleep instead of using CPU, so the detector thread pool
+is usually the limit; raise POWERHEX_DETECTOR_WORKERS to see the API's own
+ceiling. Lower POWERHEX_API_MAX_CONCURRENT_SCANS and POWERHEX_SCAN_QUEUE_SIZE
+below --clients to see the excess shed while admitted scans keep their
+latency.
+"""
+import argparse
+import io
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+from PIL import Image
+
+
+def make_image(seed):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (320, 240), tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(20):
+        x, y = rng.randrange(300), rng.randrange(220)
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 20, y + 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def start_server():
+    """Serve the API on a free local port from a background thread"""
+    import uvicorn
+    from powerhex_api import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="API base URL (default: start one in-process)")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="total scans")
+    parser.add_argument("--endpoint", choices=["scan", "stream"], default="scan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        url = args.url
+        if url is None:
+            os.environ.setdefault("POWERHEX_DB", os.path.join(tmp, "load.db"))
+            url, server = start_server()
+
+        path = "/scan" if args.endpoint == "scan" else "/scan/stream"
+        images = [make_image(seed) for seed in range(args.requests)]
+        local = threading.local()
+
+        def one(index):
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            start = time.perf_counter()
+            response = local.session.post(f"{url}{path}", data=images[index],
+                                          params={"filename": f"load-{index}.jpg"}, timeout=60)
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            outcomes = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies = [latency for latency, status in outcomes if status == 200]
+        shed = [latency for latency, status in outcomes if status in (429, 503)]
+        errors = len(outcomes) - len(latencies) - len(shed)
+        print(f"{args.requests} {args.endpoint} requests from {args.clients} clients in {elapsed:.1f}s "
+              f"({args.requests / elapsed:.1f} req/s), {len(shed)} busy, {errors} errors")
+        if latencies:
+            print(f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+                  f"p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:.0f} ms")
+        if shed:
+            print(f"busy responses p50 {percentile(shed, 50) * 1000:.0f} ms, p99 {percentile(shed, 99) * 1000:.0f} ms")
+        print("admission:", requests.get(f"{url}/stats", timeout=30).json()["admission"])
+
+        if server is not None:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Reproducible benchmark suite for the scan pipeline and dashboard queries.
+
+Runs offline with seeded fixtures (see synthetic.py) and writes one JSON
+file of timings, all in milliseconds (lower is better):
+
+- ``scan.<MP>mp.<exif>``: end-to-end scan_image (the pipeline behind
+  perform_detection) with seeded detectors, p50 over --scans runs
+- ``metadata.<exif>``: extract_metadata per image
+- ``analytics.<scans>.<query>``: the queries behind show_analytics
+- ``reporting.<scans>.<query>``: the queries behind show_reporting
+
+Seeded databases of 10k/100k/1M scans are built once and reused from
+--db-dir. Run from the repository root:
+
+    python benchmarks/run_suite.py [--scales 10000 100000 1000000] [--output results.json]
+    python benchmarks/run_suite.py --compare baseline.json   # exit 1 on regressions
+
+Compare against a baseline recorded on the same machine; timings of a few
+milliseconds vary by tens of percent between runs.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from multiprocessing import get_context
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+IMAGE_SIZES = (0.3, 2, 12)
+QUERY_REPEAT = 5
+
+
+def median_ms(fn, repeat=QUERY_REPEAT):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def bench_pipeline(scans, seed, latency_scale):
+    """End-to-end scan latency and metadata extraction; runs in a fresh database"""
+    import io
+
+    from PIL import Image
+
+    from synthetic import EXIF_LEVELS, install_seeded_detectors, make_image
+    from powerhex_db import init_database
+    from powerhex_pipeline import extract_metadata, scan_image
+
+    init_database()
+    install_seeded_detectors(seed, latency_scale)
+    results = {}
+
+    for megapixels in IMAGE_SIZES:
+        for exif in ("none", "rich"):
+            data = make_image(megapixels, exif, seed)
+            scan_image(data, "warmup.jpg", force_rescan=True)
+            samples = []
+            for index in range(scans):
+                start = time.perf_counter()
+                scan_image(data, f"bench-{index}.jpg", force_rescan=True)
+                samples.append((time.perf_counter() - start) * 1000)
+            results[f"scan.{megapixels:g}mp.{exif}"] = round(statistics.median(samples), 3)
+
+    for exif in EXIF_LEVELS:
+        data = make_image(2, exif, seed)
+        count = 200
+        start = time.perf_counter()
+        for _ in range(count):
+            extract_metadata(Image.open(io.BytesIO(data)))
+        results[f"metadata.{exif}"] = round((time.perf_counter() - start) * 1000 / count, 4)
+
+    return results
+
+
+def bench_queries(scans):
+    """Analytics and reporting query times against the configured seeded database"""
+    from powerhex_db import (
+        analytics_summary, result_distribution, confidence_histogram, daily_activity, recent_scans,
+        detector_health, stage_timings, scans_page, search_metadata, metadata_value_counts
+    )
+
+    results = {}
+    analytics = {
+        "summary": analytics_summary,
+        "result_distribution": result_distribution,
+        "confidence_histogram": confidence_histogram,
+        "daily_activity": daily_activity,
+        "recent_scans": recent_scans,
+        "detector_health": detector_health,
+        "stage_timings": stage_timings
+    }
+    for name, fn in analytics.items():
+        results[f"analytics.{scans}.{name}"] = median_ms(fn)
+
+    first_page = scans_page(False)
+    before_id = int(first_page["id"].min())
+    reporting = {
+        "unflagged_page": lambda: scans_page(False),
+        "unflagged_next_page": lambda: scans_page(False, before_id=before_id),
+        "flagged_page": lambda: scans_page(True),
+        "flagged_by_reason": lambda: scans_page(True, reason="Identity theft"),
+        "unflagged_by_result": lambda: scans_page(False, result="SUSPICIOUS"),
+        "flagged_by_date": lambda: scans_page(True, date_from=date(2025, 6, 1), date_to=date(2025, 6, 30)),
+        "metadata_search": lambda: search_metadata([("Software", "equals", "Midjourney")]),
+        "metadata_value_counts": lambda: metadata_value_counts("Model")
+    }
+    for name, fn in reporting.items():
+        results[f"reporting.{scans}.{name}"] = median_ms(fn)
+
+    return results
+
+
+def seed_if_missing(path, scans, seed):
+    from synthetic import seed_database
+
+    if os.path.exists(path):
+        return None
+    start = time.perf_counter()
+    seed_database(scans, seed)
+    return round(time.perf_counter() - start, 1)
+
+
+def in_process(db_path, fn, *args):
+    """Run fn in a fresh interpreter with POWERHEX_DB pointing at db_path"""
+    os.environ["POWERHEX_DB"] = db_path
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold, floor_ms):
+    """Names of timings more than `threshold` (fraction) and floor_ms slower than the baseline"""
+    regressions = []
+    for name, value in sorted(results.items()):
+        old = baseline.get(name)
+        if old is not None and value > old * (1 + threshold) and value - old > floor_ms:
+            regressions.append(f"{name}: {old:.3f} -> {value:.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="seeded database sizes (scans)")
+    parser.add_argument("--scans", type=int, default=10, help="end-to-end scans per image variant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=0.01,
+                        help="seeded detector latency as a fraction of the mocks' (0 = no sleeping)")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "powerhex-bench"),
+                        help="where seeded databases are kept between runs")
+    parser.add_argument("--output", default=os.path.join(HERE, "results", f"{datetime.now():%Y%m%d-%H%M%S}.json"))
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed slowdown over the baseline")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = {}
+    seeding = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("pipeline ...", file=sys.stderr)
+        results.update(in_process(os.path.join(tmp, "pipeline.db"), bench_pipeline,
+                                  args.scans, args.seed, args.latency_scale))
+
+    for scans in args.scales:
+        path = os.path.join(args.db_dir, f"powerhex_seed{args.seed}_{scans}.db")
+        print(f"{scans} scans ...", file=sys.stderr)
+        seconds = in_process(path, seed_if_missing, path, scans, args.seed)
+        if seconds is not None:
+            seeding[scans] = seconds
+        results.update(in_process(path, bench_queries, scans))
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "seeding_seconds": seeding,
+        "results_ms": results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, value in results.items():
+        print(f"{name:<50} {value:>12.3f} ms")
+    print(f"wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results_ms"]
+        regressions = compare(results, baseline, args.threshold, args.floor_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
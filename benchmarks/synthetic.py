@@ -0,0 +1,148 @@
+"""Deterministic fixtures shared by the benchmark suite.
+
+- ``make_image``: synthetic JPEGs of a given size and EXIF richness.
+- ``install_seeded_detectors``: replaces the mock detectors and reverse
+  search with seeded versions whose scores depend only on the seed and the
+  image content, and whose latency is a fixed fraction of the mocks'.
+- ``seed_database``: fills an empty PowerHEX database with synthetic scans.
+
+Everything here must be imported after POWERHEX_DB points at the database
+the caller wants to use.
+"""
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image
+from PIL.ExifTags import IFD
+
+EXIF_LEVELS = ("none", "basic", "rich")
+RESULTS = ("LIKELY GENUINE", "SUSPICIOUS", "LIKELY FAKE", "INCONCLUSIVE")
+RESULT_WEIGHTS = (55, 25, 18, 2)
+REASONS = ("Suspected deepfake", "Identity theft", "Misinformation", "Inappropriate content", "Other")
+CAMERAS = [("Canon", "EOS R5"), ("Nikon", "Z 6II"), ("Apple", "iPhone 15"), ("Google", "Pixel 8"), ("Sony", "A7 IV")]
+SOFTWARE = ("Adobe Photoshop 25.0", "GIMP 2.10", "Lightroom", "Midjourney", "Stable Diffusion", "HDR+ 1.0")
+# Fixed end of the seeded history, so seeded databases are identical run to run
+SEED_END = datetime(2026, 1, 1)
+
+# Nominal latencies of the original mocks, in seconds
+MOCK_LATENCY = {"deepware": 2.0, "faceforensics": 1.5, "reverse_search": 1.0}
+
+
+def make_image(megapixels, exif="basic", seed=0):
+    """A JPEG of about `megapixels` with no, basic or rich (sub-IFD, MakerNote) EXIF"""
+    rng = random.Random(seed)
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = Image.effect_mandelbrot((width, height), (-2.0 + rng.random() * 0.1, -1.2, 1.0, 1.2), 48).convert("RGB")
+
+    exif_data = Image.Exif()
+    if exif in ("basic", "rich"):
+        make, model = rng.choice(CAMERAS)
+        exif_data[0x010F] = make
+        exif_data[0x0110] = model
+        exif_data[0x0131] = rng.choice(SOFTWARE)
+        exif_data[0x0132] = "2025:06:01 12:00:00"
+    if exif == "rich":
+        sub = exif_data.get_ifd(IFD.Exif)
+        sub[0x829A] = 1 / 250
+        sub[0x829D] = 2.8
+        sub[0x8827] = 400
+        sub[0x9003] = "2025:06:01 12:00:00"
+        sub[0xA434] = "RF24-70mm F2.8 L IS USM"
+        sub[0x927C] = bytes(rng.getrandbits(8) for _ in range(4096))
+        sub[0x9286] = b"ASCII\x00\x00\x00synthetic benchmark image"
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90, exif=exif_data)
+    return buffer.getvalue()
+
+
+def install_seeded_detectors(seed=0, latency_scale=0.01):
+    """Swap the random mocks for seeded ones sleeping latency_scale x their nominal time"""
+    import powerhex_detectors
+    from powerhex_cache import content_hash
+    from powerhex_detectors import DetectorBackend, register_detector
+
+    class SeededMock(DetectorBackend):
+        def __init__(self, key, api_name, low, high, threshold, **kwargs):
+            super().__init__(api_name, **kwargs)
+            self.key = key
+            self.low, self.high, self.threshold = low, high, threshold
+
+        def detect(self, image_data):
+            rng = random.Random(f"{seed}:{self.key}:{content_hash(image_data)}")
+            time.sleep(MOCK_LATENCY[self.key] * latency_scale)
+            confidence = rng.uniform(self.low, self.high)
+            return {
+                "is_fake": confidence > self.threshold,
+                "confidence": confidence,
+                "api_name": self.api_name,
+                "details": {"seed": seed}
+            }
+
+    def reverse_image_search(image_hash):
+        rng = random.Random(f"{seed}:reverse:{image_hash}")
+        time.sleep(MOCK_LATENCY["reverse_search"] * latency_scale)
+        return [
+            {"source": "TinEye", "matches": rng.randint(0, 15), "earliest_date": "2023-03-15"},
+            {"source": "Google Images", "matches": rng.randint(0, 25), "earliest_date": "2023-01-20"}
+        ]
+
+    register_detector("deepware", SeededMock("deepware", "Deepware API", 0.15, 0.95, 0.6, cost=2.0))
+    register_detector("faceforensics", SeededMock("faceforensics", "FaceForensics++", 0.2, 0.9, 0.55, cost=1.5))
+    powerhex_detectors.reverse_image_search = reverse_image_search
+
+
+def _synthetic_scan(rng, scan_id):
+    result = rng.choices(RESULTS, RESULT_WEIGHTS)[0]
+    confidence = None if result == "INCONCLUSIVE" else rng.random()
+    timestamp = SEED_END - timedelta(seconds=rng.randrange(365 * 86400))
+    flagged = rng.random() < 0.02
+    detectors = {
+        key: {
+            "is_fake": None if confidence is None else confidence > 0.6,
+            "confidence": confidence,
+            "api_name": api_name,
+            "details": {},
+            "latency_ms": round(MOCK_LATENCY[key] * 1000 * rng.uniform(0.8, 1.3), 1)
+        }
+        for key, api_name in (("deepware", "Deepware API"), ("faceforensics", "FaceForensics++"))
+    }
+    timings = {"hash": rng.uniform(0.01, 0.1), "metadata": rng.uniform(0.1, 1), "detectors": rng.uniform(1500, 2600)}
+    row = (
+        scan_id, f"seed-{scan_id}.jpg", f"{rng.getrandbits(128):032x}", result, confidence,
+        timestamp.isoformat(sep=" "), None, json.dumps(detectors), json.dumps(timings),
+        flagged, f"{rng.choice(REASONS)}: seeded" if flagged else None
+    )
+    make, model = rng.choice(CAMERAS)
+    metadata = [(scan_id, "Make", make), (scan_id, "Model", model), (scan_id, "Software", rng.choice(SOFTWARE))]
+    return row, metadata, (scan_id, rng.getrandbits(64) - (1 << 63))
+
+
+def seed_database(scans, seed=0, chunk=10_000):
+    """Insert `scans` synthetic scans (with metadata tags and pHashes) into the empty configured database"""
+    from powerhex_db import connection, init_database
+    from powerhex_rollup import run_rollup
+
+    init_database()
+    rng = random.Random(seed)
+    for start in range(1, scans + 1, chunk):
+        rows, tags, phashes = [], [], []
+        for scan_id in range(start, min(start + chunk, scans + 1)):
+            row, metadata, phash = _synthetic_scan(rng, scan_id)
+            rows.append(row)
+            tags.extend(metadata)
+            phashes.append(phash)
+        with connection() as conn:
+            conn.executemany('''
+                INSERT INTO scans (id, filename, file_hash, scan_result, confidence_score, timestamp,
+                                   metadata, detector_results, timings, flagged, flag_reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.executemany("INSERT INTO scan_metadata (scan_id, key, value) VALUES (?, ?, ?)", tags)
+            conn.executemany("INSERT INTO scan_phashes (scan_id, phash) VALUES (?, ?)", phashes)
+    # Fold the change log into the dashboard snapshots, as the app's rollup worker would
+    run_rollup()
@@ -0,0 +1,252 @@
+"""Admission control for scan requests.
+
+Every scan that runs in this process (an "Analyze Image" click, a
+moderator re-scan, an API request) first takes a slot from the process's
+AdmissionController, so a traffic spike queues or is turned away instead
+of slowing every scan down together:
+
+- Rate: each session gets a token bucket of SESSION_SCAN_BURST scans,
+  refilled at SESSION_SCAN_RATE per minute.
+- Concurrency: at most MAX_CONCURRENT_SCANS scans run at once, and a
+  session holds at most SESSION_MAX_SCANS of the running and waiting ones.
+- Queue: requests beyond the concurrency limit wait in a priority queue of
+  SCAN_QUEUE_SIZE, moderators first, then oldest first. When it is full a
+  request is rejected at once; a moderator request instead takes the place
+  of the newest ordinary one. A request still waiting after
+  SCAN_QUEUE_TIMEOUT seconds gives up.
+
+Rejected requests raise Busy, with a reason and a retry hint. Background
+jobs are admitted with the same bucket and session limit, and the job
+queue is bounded at SCAN_JOB_QUEUE_LIMIT (see admit_job). Queue depth,
+admissions and rejections are kept per controller (see stats) and queue
+waits go into the metrics registry.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from powerhex_metrics import metrics
+
+MAX_CONCURRENT_SCANS = int(os.environ.get("POWERHEX_MAX_CONCURRENT_SCANS", "4"))
+SESSION_MAX_SCANS = int(os.environ.get("POWERHEX_SESSION_MAX_SCANS", "2"))
+# Scans per minute per session, and the burst allowed on top; 0 turns rate limiting off
+SESSION_SCAN_RATE = float(os.environ.get("POWERHEX_SESSION_SCAN_RATE", "10"))
+SESSION_SCAN_BURST = int(os.environ.get("POWERHEX_SESSION_SCAN_BURST", "5"))
+SCAN_QUEUE_SIZE = int(os.environ.get("POWERHEX_SCAN_QUEUE_SIZE", "16"))
+SCAN_QUEUE_TIMEOUT = float(os.environ.get("POWERHEX_SCAN_QUEUE_TIMEOUT", "30"))
+# Queued background jobs beyond which new ordinary submissions are rejected
+SCAN_JOB_QUEUE_LIMIT = int(os.environ.get("POWERHEX_SCAN_JOB_QUEUE_LIMIT", "200"))
+# Seconds clients are told to wait when the limit is not a rate
+RETRY_AFTER = 5
+
+WAIT_METRIC = "powerhex_admission_wait_seconds"
+
+# Lower is served first
+PRIORITY_MODERATOR = 0
+PRIORITY_USER = 1
+PRIORITY_NAMES = {PRIORITY_MODERATOR: "moderator", PRIORITY_USER: "user"}
+
+REJECT_MESSAGES = {
+    "rate_limited": "too many scans from this session",
+    "session_limit": "this session already has the most scans allowed running",
+    "queue_full": "the scan queue is full",
+    "shed": "a moderator request took this place in the queue",
+    "timeout": "no scanner became free in time",
+}
+
+# Token buckets kept before idle (full) ones are dropped
+MAX_TRACKED_SESSIONS = 10_000
+
+class Busy(Exception):
+    """A scan request turned away; reason is a REJECT_MESSAGES key, retry_after in seconds"""
+
+    def __init__(self, reason, retry_after=RETRY_AFTER):
+        super().__init__(REJECT_MESSAGES[reason])
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """`burst` tokens, refilled continuously at `rate` per second"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token; returns 0, or the seconds until one is available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "session", "event", "granted", "shed")
+
+    def __init__(self, priority, seq, session):
+        self.priority = priority
+        self.seq = seq
+        self.session = session
+        self.event = threading.Event()
+        self.granted = False
+        self.shed = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class AdmissionController:
+    """Rate limits, concurrency limits and a bounded priority queue in front of the scan pipeline"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_SCANS, session_max=SESSION_MAX_SCANS,
+                 rate_per_minute=SESSION_SCAN_RATE, burst=SESSION_SCAN_BURST,
+                 queue_size=SCAN_QUEUE_SIZE, queue_timeout=SCAN_QUEUE_TIMEOUT,
+                 job_queue_limit=SCAN_JOB_QUEUE_LIMIT):
+        self.max_concurrent = max_concurrent
+        self.session_max = session_max
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.job_queue_limit = job_queue_limit
+        self.in_flight = 0
+        self.admitted = Counter()
+        self.rejected = Counter()
+        self._waiting = []
+        self._sessions = Counter()
+        self._buckets = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _reject(self, reason, retry_after=RETRY_AFTER):
+        self.rejected[reason] += 1
+        return Busy(reason, retry_after)
+
+    def _take_token(self, session, priority):
+        """Raise Busy('rate_limited') if the session's bucket is empty; moderators are not rate limited"""
+        if self.rate <= 0 or priority == PRIORITY_MODERATOR:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(session)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_SESSIONS:
+                for key, idle in list(self._buckets.items()):
+                    idle.refill(now)
+                    if idle.tokens >= idle.burst:
+                        del self._buckets[key]
+            bucket = self._buckets[session] = TokenBucket(self.rate, self.burst)
+        wait = bucket.take(now)
+        if wait:
+            raise self._reject("rate_limited", wait)
+
+    def acquire(self, session, priority=PRIORITY_USER):
+        """Wait for a scan slot; raises Busy if the request is rejected. Pair with release(session)."""
+        start = time.monotonic()
+        name = PRIORITY_NAMES[priority]
+        with self._lock:
+            free = self.in_flight < self.max_concurrent and not self._waiting
+            newest = None
+            if not free and len(self._waiting) >= self.queue_size:
+                newest = max(self._waiting, default=None)
+                if newest is None or newest.priority <= priority:
+                    raise self._reject("queue_full")
+            if self._sessions[session] >= self.session_max:
+                raise self._reject("session_limit")
+            self._take_token(session, priority)
+            self._sessions[session] += 1
+            if free:
+                self.in_flight += 1
+                self.admitted[name] += 1
+                waiter = None
+            else:
+                if newest is not None:
+                    # Full: the newest ordinary request makes room for a moderator
+                    self._remove_waiter(newest)
+                    newest.shed = True
+                    newest.event.set()
+                    self.rejected["shed"] += 1
+                waiter = _Waiter(priority, next(self._seq), session)
+                heapq.heappush(self._waiting, waiter)
+
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            with self._lock:
+                if waiter.shed:
+                    raise Busy("shed")
+                if not waiter.granted:
+                    self._remove_waiter(waiter)
+                    raise self._reject("timeout")
+                self.admitted[name] += 1
+        metrics.observe(WAIT_METRIC, time.monotonic() - start, priority=name)
+
+    def _leave(self, session):
+        self._sessions[session] -= 1
+        if self._sessions[session] <= 0:
+            del self._sessions[session]
+
+    def _remove_waiter(self, waiter):
+        self._waiting.remove(waiter)
+        heapq.heapify(self._waiting)
+        self._leave(waiter.session)
+
+    def release(self, session):
+        """Give back a slot taken with acquire; the first waiter, if any, gets it"""
+        with self._lock:
+            self._leave(session)
+            if self._waiting:
+                waiter = heapq.heappop(self._waiting)
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, session, priority=PRIORITY_USER):
+        """Run the block in an admitted scan slot; raises Busy if the request is rejected"""
+        self.acquire(session, priority)
+        try:
+            yield
+        finally:
+            self.release(session)
+
+    def admit_job(self, session, pending_jobs, queued_jobs, priority=PRIORITY_USER):
+        """Admit a background job submission or raise Busy.
+
+        pending_jobs are the session's unfinished jobs, queued_jobs all
+        queued jobs. The session's bucket and scan limit apply as for
+        scans run in this process, and ordinary submissions are rejected
+        while the job queue is at job_queue_limit.
+        """
+        with self._lock:
+            if priority != PRIORITY_MODERATOR and queued_jobs >= self.job_queue_limit:
+                raise self._reject("queue_full")
+            if pending_jobs + self._sessions[session] >= self.session_max:
+                raise self._reject("session_limit")
+            self._take_token(session, priority)
+            self.admitted[PRIORITY_NAMES[priority]] += 1
+
+    def stats(self):
+        """Running and queued scans, admissions per priority and rejections per reason"""
+        with self._lock:
+            queued = Counter(PRIORITY_NAMES[waiter.priority] for waiter in self._waiting)
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._waiting),
+                "queued_by_priority": {name: queued[name] for name in PRIORITY_NAMES.values()},
+                "admitted": {name: self.admitted[name] for name in PRIORITY_NAMES.values()},
+                "rejected": {reason: self.rejected[reason] for reason in REJECT_MESSAGES},
+                "max_concurrent": self.max_concurrent,
+                "queue_size": self.queue_size
+            }
+
+# Controller of this process (the Streamlit app)
+admission = AdmissionController()
@@ -0,0 +1,305 @@
+"""Headless HTTP API for PowerHEX, next to the Streamlit UI.
+
+Run with:
+
+    python powerhex_api.py --port 8000
+
+Endpoints (image bodies are the raw file bytes; ``?filename=`` names the
+upload and ``?force=1`` ignores cached results):
+
+    POST /scan          one image or clip -> JSON result
+    POST /scan/stream   one image -> NDJSON, a line per detector as it
+                        finishes, then the final result; for videos and
+                        animated images a line per analyzed frame, then
+                        the combined detector results and the final result
+    POST /batch         multipart files or a zip archive -> NDJSON, a line
+                        per image as it finishes
+    GET  /stats         totals, result distribution, detector health,
+                        job queue depth, admission counters and cache hit rate
+    GET  /metrics       stage, detector and admission wait latency histograms
+                        and queue gauges, Prometheus text
+    GET  /health
+
+Handlers are async; the blocking pipeline runs on worker threads, at most
+API_MAX_CONCURRENT_SCANS at a time, so one process serves many clients.
+Scans (each image of a batch too) pass admission control first (see
+powerhex_admission), keyed per client (see client_key): beyond that many
+running scans they wait in a bounded queue, and when it is full they get
+503 with a Retry-After header (429 when a client exceeds
+API_CLIENT_SCAN_RATE). Behind a load balancer set API_TRUSTED_PROXIES or
+API_CLIENT_HEADER, or every client shares the balancer's address.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import zipfile
+from contextlib import asynccontextmanager
+
+import anyio
+from PIL import UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from powerhex_admission import SCAN_QUEUE_SIZE, SCAN_QUEUE_TIMEOUT, SESSION_SCAN_BURST, AdmissionController, Busy
+from powerhex_bulk import DEFAULT_BULK_WORKERS, bulk_scan, iter_zip
+from powerhex_cache import result_cache
+from powerhex_db import analytics_summary, detector_health, init_database, job_queue_depth, result_distribution
+from powerhex_detectors import detector_stats
+from powerhex_ingest import ImageTooLargeError
+from powerhex_metrics import metrics
+from powerhex_pipeline import analyze_image, save_scans, scan_image
+from powerhex_rollup import ensure_rollup_thread
+
+API_MAX_CONCURRENT_SCANS = int(os.environ.get("POWERHEX_API_MAX_CONCURRENT_SCANS", "32"))
+# Per client address: running and waiting scans (by default any one client
+# may fill the queue) and scans per minute (0 = no rate limit)
+API_CLIENT_MAX_SCANS = int(os.environ.get("POWERHEX_API_CLIENT_MAX_SCANS", "0")) or API_MAX_CONCURRENT_SCANS + SCAN_QUEUE_SIZE
+API_CLIENT_SCAN_RATE = float(os.environ.get("POWERHEX_API_CLIENT_SCAN_RATE", "0"))
+# How clients are told apart: by default the peer address. With N trusted
+# proxies in front (load balancers that append to X-Forwarded-For), the
+# address the outermost of them saw; with a client header (e.g. X-API-Key,
+# set or checked by an authenticating gateway), its value when present
+API_TRUSTED_PROXIES = int(os.environ.get("POWERHEX_API_TRUSTED_PROXIES", "0"))
+API_CLIENT_HEADER = os.environ.get("POWERHEX_API_CLIENT_HEADER", "")
+
+NDJSON = "application/x-ndjson"
+
+_limiter = None
+
+api_admission = AdmissionController(
+    max_concurrent=API_MAX_CONCURRENT_SCANS,
+    session_max=API_CLIENT_MAX_SCANS,
+    rate_per_minute=API_CLIENT_SCAN_RATE,
+    burst=SESSION_SCAN_BURST,
+    queue_size=SCAN_QUEUE_SIZE,
+    queue_timeout=SCAN_QUEUE_TIMEOUT
+)
+
+def scan_limiter():
+    """Capacity limiter for pipeline threads, created inside the event loop"""
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(API_MAX_CONCURRENT_SCANS)
+    return _limiter
+
+def to_json(value):
+    return json.dumps(value, default=str)
+
+def scan_options(request):
+    return request.query_params.get("filename", "upload"), request.query_params.get("force") in ("1", "true")
+
+def busy_response(e):
+    status = 429 if e.reason == "rate_limited" else 503
+    return JSONResponse({"error": "busy", "reason": e.reason, "detail": str(e), "retry_after": round(e.retry_after, 1)},
+                        status_code=status, headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def client_key(request):
+    """Admission key of a request: its client header, forwarded address or peer address"""
+    if API_CLIENT_HEADER and request.headers.get(API_CLIENT_HEADER):
+        return "header:" + request.headers[API_CLIENT_HEADER]
+    address = request.client.host if request.client else "unknown"
+    if API_TRUSTED_PROXIES > 0:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if hops:
+            # Entries left of the trusted proxies' own can be forged by the client
+            address = hops[-min(API_TRUSTED_PROXIES, len(hops))]
+    return address
+
+async def admit(request):
+    """Wait for an admission slot for the request's client; returns the client key. Raises Busy."""
+    client = client_key(request)
+    await anyio.to_thread.run_sync(api_admission.acquire, client)
+    return client
+
+def error_response(e):
+    if isinstance(e, ImageTooLargeError):
+        return JSONResponse({"error": str(e)}, status_code=413)
+    return JSONResponse({"error": "not a readable image"}, status_code=415)
+
+async def read_image(request):
+    body = await request.body()
+    if not body:
+        raise ValueError("empty request body")
+    return body
+
+def stream_from_thread(fn, on_done=None, limiter=None):
+    """NDJSON response fed by fn(emit) running on a thread of `limiter` (scan_limiter()); on_done() runs after fn"""
+    async def lines():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def emit(record):
+            loop.call_soon_threadsafe(queue.put_nowait, record)
+
+        def run():
+            try:
+                fn(emit)
+            except (ImageTooLargeError, UnidentifiedImageError) as e:
+                emit({"event": "error", "error": str(e)})
+            finally:
+                if on_done is not None:
+                    on_done()
+                emit(done)
+
+        task = asyncio.ensure_future(anyio.to_thread.run_sync(run, limiter=limiter or scan_limiter()))
+        while True:
+            record = await queue.get()
+            if record is done:
+                break
+            yield to_json(record) + "\n"
+        await task
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+async def scan(request):
+    try:
+        image_bytes = await read_image(request)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    filename, force_rescan = scan_options(request)
+
+    try:
+        client = await admit(request)
+    except Busy as e:
+        return busy_response(e)
+    try:
+        results = await anyio.to_thread.run_sync(
+            lambda: scan_image(image_bytes, filename, force_rescan=force_rescan), limiter=scan_limiter()
+        )
+    except (ImageTooLargeError, UnidentifiedImageError) as e:
+        return error_response(e)
+    finally:
+        api_admission.release(client)
+    return Response(to_json(results), media_type="application/json")
+
+async def scan_stream(request):
+    try:
+        image_bytes = await read_image(request)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    filename, force_rescan = scan_options(request)
+
+    def run(emit):
+        results = analyze_image(
+            image_bytes, filename, force_rescan=force_rescan,
+            on_detector=lambda key, result: emit({"event": "detector", "detector": key, "result": result}),
+            on_frame=lambda frame: emit({"event": "frame", "frame": frame})
+        )
+        if not results["cached"]:
+            save_scans([results])
+        emit({"event": "result", "result": results})
+
+    try:
+        client = await admit(request)
+    except Busy as e:
+        return busy_response(e)
+    return stream_from_thread(run, on_done=lambda: api_admission.release(client))
+
+async def batch(request):
+    force_rescan = scan_options(request)[1]
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        items = [
+            (upload.filename, lambda upload=upload: upload.file.read())
+            for _, upload in form.multi_items() if hasattr(upload, "filename")
+        ]
+    else:
+        body = await request.body()
+        if not zipfile.is_zipfile(io.BytesIO(body)):
+            return JSONResponse({"error": "send multipart files or a zip archive"}, status_code=400)
+        items = iter_zip(io.BytesIO(body))
+
+    # Every image takes its own admission slot, so a batch counts against
+    # the global limit like that many single scans
+    client = client_key(request)
+    workers = max(1, min(DEFAULT_BULK_WORKERS, api_admission.session_max))
+
+    def run(emit):
+        for name, results, error in bulk_scan(items, workers=workers, force_rescan=force_rescan,
+                                               slot=lambda: api_admission.slot(client)):
+            emit({"event": "result", "filename": name, "result": results, "error": error})
+
+    # The batch's own thread only hands out images and waits; it takes no scan slot
+    return stream_from_thread(run, limiter=anyio.CapacityLimiter(1))
+
+async def stats(request):
+    def collect():
+        return {
+            "summary": analytics_summary(),
+            "results": result_distribution().to_dict(orient="records"),
+            "detector_health": detector_health().to_dict(orient="records"),
+            "detectors": detector_stats(),
+            "job_queue_depth": job_queue_depth(),
+            "admission": api_admission.stats(),
+            "cache": {"entries": len(result_cache), "hits": result_cache.hits, "misses": result_cache.misses}
+        }
+
+    return Response(to_json(await anyio.to_thread.run_sync(collect)), media_type="application/json")
+
+async def prometheus_metrics(request):
+    depth = await anyio.to_thread.run_sync(job_queue_depth)
+    gauges = (
+        "# TYPE powerhex_job_queue_depth gauge\n"
+        f'powerhex_job_queue_depth{{status="queued"}} {depth.get("queued", 0)}\n'
+        f'powerhex_job_queue_depth{{status="running"}} {depth.get("running", 0)}\n'
+        "# TYPE powerhex_result_cache_hits_total counter\n"
+        f"powerhex_result_cache_hits_total {result_cache.hits}\n"
+        "# TYPE powerhex_result_cache_misses_total counter\n"
+        f"powerhex_result_cache_misses_total {result_cache.misses}\n"
+    )
+    control = api_admission.stats()
+    gauges += (
+        "# TYPE powerhex_admission_in_flight gauge\n"
+        f"powerhex_admission_in_flight {control['in_flight']}\n"
+        "# TYPE powerhex_admission_queue_depth gauge\n"
+        + "".join(f'powerhex_admission_queue_depth{{priority="{name}"}} {count}\n'
+                  for name, count in control["queued_by_priority"].items())
+        + "# TYPE powerhex_admission_admitted_total counter\n"
+        + "".join(f'powerhex_admission_admitted_total{{priority="{name}"}} {count}\n'
+                  for name, count in control["admitted"].items())
+        + "# TYPE powerhex_admission_rejected_total counter\n"
+        + "".join(f'powerhex_admission_rejected_total{{reason="{reason}"}} {count}\n'
+                  for reason, count in control["rejected"].items())
+    )
+    return Response(metrics.prometheus_text() + gauges, media_type="text/plain; version=0.0.4")
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+@asynccontextmanager
+async def lifespan(app):
+    init_database()
+    # /stats reads the dashboard snapshots; keep them current without the app
+    ensure_rollup_thread()
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/scan", scan, methods=["POST"]),
+        Route("/scan/stream", scan_stream, methods=["POST"]),
+        Route("/batch", batch, methods=["POST"]),
+        Route("/stats", stats),
+        Route("/metrics", prometheus_metrics),
+        Route("/health", health),
+    ],
+    lifespan=lifespan
+)
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the PowerHEX HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,52 @@
 import streamlit as st
 import requests
-import hashlib
 import json
 import os
 from datetime import datetime
-import sqlite3
+import time
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from PIL import Image, ExifTags
-from PIL.ExifTags import TAGS
+from PIL import Image, ExifTags, UnidentifiedImageError
 import io
 import base64
-import time
-import random
+import hmac
+import uuid
+from powerhex_db import (
+    CONFIDENCE_BINS, init_database, insert_quiz_result, analytics_summary,
+    result_distribution, confidence_histogram, daily_activity, recent_scans, detector_health,
+    REPORT_PAGE_SIZE, scans_page, flag_scans, resolve_reports, count_matching_reports, resolve_matching_reports,
+    METADATA_OPERATORS, metadata_keys, metadata_value_counts, search_metadata,
+    stage_timings, job_queue_depth, data_version, get_pool, storage_stats, pending_scan_changes
+)
+from powerhex_pipeline import scan_image
+from powerhex_detectors import detector_stats
+from powerhex_bulk import DEFAULT_BULK_WORKERS, bulk_scan, summarize
+from powerhex_jobs import ensure_local_workers, job_status, submit_scan
+from powerhex_ingest import ImageTooLargeError
+from powerhex_video import ANIMATION_EXTENSIONS, VIDEO_EXTENSIONS, Clip, open_media
+from powerhex_cache import content_hash, result_cache
+from powerhex_metrics import DETECTOR_METRIC, STAGE_METRIC, metrics
+from powerhex_retention import (
+    RETENTION_FULL_DAYS, RETENTION_ARCHIVE_DAYS, archive_stats, ensure_retention_thread, last_run,
+    run_retention, scan_history
+)
+from powerhex_rollup import ROLLUP_INTERVAL, ensure_rollup_thread
+from powerhex_admission import PRIORITY_MODERATOR, PRIORITY_USER, Busy, admission
+
+JOB_REFRESH_SECONDS = 1.0
+# Shared secret that unlocks moderator re-scans; unset turns them off
+MODERATOR_TOKEN = os.environ.get("POWERHEX_MODERATOR_TOKEN", "")
+METADATA_FILTER_ROWS = 3
+REPORT_REASONS = [
+    "Suspected deepfake",
+    "Identity theft",
+    "Misinformation",
+    "Inappropriate content",
+    "Other"
+]
+SCAN_RESULTS = ["LIKELY FAKE", "SUSPICIOUS", "LIKELY GENUINE", "INCONCLUSIVE"]
+UPLOAD_TYPES = ['png', 'jpg', 'jpeg'] + [extension[1:] for extension in ANIMATION_EXTENSIONS + VIDEO_EXTENSIONS]
 
 # Page configuration
 st.set_page_config(
@@ -71,228 +104,321 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize database
-def init_database():
-    conn = sqlite3.connect('powerhex_data.db')
-    cursor = conn.cursor()
-    
-    # Create tables
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            file_hash TEXT,
-            scan_result TEXT,
-            confidence_score REAL,
-            timestamp DATETIME,
-            metadata TEXT,
-            flagged BOOLEAN DEFAULT FALSE,
-            flag_reason TEXT
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS educational_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            quiz_taken BOOLEAN,
-            score INTEGER,
-            timestamp DATETIME
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-# Mock AI Detection APIs (simulating real APIs for demo)
-class MockDetectionAPIs:
-    @staticmethod
-    def deepware_detection(image_data):
-        """Simulate Deepware API response"""
-        # Simulate processing time
-        time.sleep(2)
-        
-        # Random but realistic results for demo
-        confidence = random.uniform(0.15, 0.95)
-        is_fake = confidence > 0.6
-        
-        return {
-            "is_fake": is_fake,
-            "confidence": confidence,
-            "api_name": "Deepware API",
-            "details": {
-                "face_detected": True,
-                "manipulation_type": "deepfake" if is_fake else "none",
-                "processing_time": "2.1s"
-            }
-        }
-    
-    @staticmethod
-    def faceforensics_detection(image_data):
-        """Simulate FaceForensics detection"""
-        time.sleep(1.5)
-        
-        confidence = random.uniform(0.2, 0.9)
-        is_fake = confidence > 0.55
-        
-        return {
-            "is_fake": is_fake,
-            "confidence": confidence,
-            "api_name": "FaceForensics++",
-            "details": {
-                "compression_artifacts": random.choice([True, False]),
-                "temporal_consistency": random.choice(["consistent", "inconsistent"]),
-                "neural_network_traces": is_fake
-            }
-        }
+# Cached resources and views
+#
+# Every widget interaction reruns this script. The schema and connection pool
+# are set up once per process; views of the scans table are cached per
+# scans data_version, bumped once by every write to scans (a save, a flag,
+# a bulk resolve), so a rerun without new data only reads one counter. The
+# dashboard totals and charts are keyed on the 'dashboard' version instead,
+# bumped by the rollup worker when it updates the snapshots they are read
+# from, so they are not rebuilt for every new scan.
+@st.cache_resource(show_spinner=False)
+def setup_database():
+    """Create the schema, open the connection pool and start the retention and rollup threads once per process"""
+    init_database()
+    ensure_retention_thread()
+    ensure_rollup_thread()
+    return get_pool()
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def analytics_view(dashboard_version):
+    """Analytics Dashboard totals and figures for one snapshot version"""
+    summary = analytics_summary()
+    if summary["total"] == 0:
+        return {"summary": summary}
+
+    fig_pie = px.pie(result_distribution(), values='count', names='scan_result',
+                     title="Detection Results Distribution")
+    fig_hist = px.bar(confidence_histogram(), x='confidence_score', y='count',
+                      title="Confidence Score Distribution")
+    fig_hist.update_traces(offset=0, width=1 / CONFIDENCE_BINS)
+    fig_line = px.line(daily_activity(), x='date', y='count', title='Daily Scan Activity')
+
+    return {
+        "summary": summary,
+        "fig_pie": fig_pie,
+        "fig_hist": fig_hist,
+        "fig_line": fig_line
+    }
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def recent_view(version):
+    """Recent scans and detector health for one data version"""
+    return {"recent": recent_scans(10), "health": detector_health()}
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def metadata_keys_view(version):
+    return metadata_keys()['key'].tolist()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def metadata_frequency_view(key, version):
+    """Most common values of one tag and their bar chart"""
+    counts = metadata_value_counts(key)
+    counts['value'] = counts['value'].astype(str)
+    return px.bar(counts, x='value', y='scans', title=f"Most common values of {key}")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def metadata_search_view(filters, version):
+    return search_metadata(list(filters))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def operations_view(version):
+    """Stored stage and detector latencies for one data version"""
+    stages = stage_timings(1000)
+    fig_stages = None
+    if len(stages) > 0:
+        fig_stages = px.bar(stages.melt(id_vars='stage', value_vars=['p50_ms', 'p95_ms', 'p99_ms'],
+                                        var_name='percentile', value_name='ms'),
+                            x='stage', y='ms', color='percentile', barmode='group', title="Stage latency percentiles")
+    return {"stages": stages, "fig_stages": fig_stages, "health": detector_health()}
+
+def session_upload(image_bytes):
+    """The decoded upload (image or clip) for this session, reused across reruns while the same file is selected"""
+    key = content_hash(image_bytes)
+    cached = st.session_state.get("upload")
+    if cached is None or cached[0] != key:
+        upload = open_media(image_bytes)
+        upload.preview()
+        cached = st.session_state["upload"] = (key, upload)
+    return cached[1]
+
+# Admission control (see powerhex_admission.py)
+def session_id():
+    """Key of this browser session for the per-session scan limits"""
+    return st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+def is_moderator(token):
+    """Whether a token entered on the page matches POWERHEX_MODERATOR_TOKEN"""
+    return bool(MODERATOR_TOKEN) and hmac.compare_digest(token.encode(), MODERATOR_TOKEN.encode())
 
-# Image metadata extraction
-def extract_metadata(image):
-    """Extract EXIF metadata from image"""
+def show_busy(e):
+    st.warning(f"⏳ PowerHEX is busy: {e}. Please try again in {max(e.retry_after, 1):.0f} s.")
+
+def submit_background_scan(filename, image_bytes, force_rescan=False):
+    """Queue a scan for the background workers if admitted; returns the job id or None"""
+    jobs = job_status(st.session_state.get("scan_jobs", []))
+    pending = sum(job["status"] in ("queued", "running") for job in jobs.values())
     try:
-        exifdata = image.getexif()
-        metadata = {}
-        
-        if exifdata:
-            for tag_id in exifdata:
-                tag = TAGS.get(tag_id, tag_id)
-                data = exifdata.get(tag_id)
-                
-                if isinstance(data, bytes):
-                    data = data.decode()
-                    
-                metadata[tag] = data
-        
-        # Add basic image info
-        metadata.update({
-            "Image Size": f"{image.size[0]} x {image.size[1]}",
-            "Image Mode": image.mode,
-            "Image Format": image.format
-        })
-        
-        return metadata
-    except Exception as e:
-        return {"Error": f"Could not extract metadata: {str(e)}"}
-
-# Reverse image search simulation
-def reverse_image_search(image_hash):
-    """Simulate reverse image search"""
-    time.sleep(1)
-    
-    # Mock results
-    results = [
-        {"source": "TinEye", "matches": random.randint(0, 15), "earliest_date": "2023-03-15"},
-        {"source": "Google Images", "matches": random.randint(0, 25), "earliest_date": "2023-01-20"}
-    ]
-    
-    return results
+        admission.admit_job(session_id(), pending, job_queue_depth().get("queued", 0))
+    except Busy as e:
+        show_busy(e)
+        return None
+    job_id = submit_scan(image_bytes, filename, force_rescan=force_rescan)
+    st.session_state.setdefault("scan_jobs", []).append(job_id)
+    return job_id
 
 # Main detection function
-def perform_detection(image, filename):
-    """Perform comprehensive image detection"""
+def perform_detection(filename, image_bytes, force_rescan=False, priority=PRIORITY_USER):
+    """Perform comprehensive image detection
     
-    # Convert image to bytes for API calls
-    img_byte_arr = io.BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    img_byte_arr = img_byte_arr.getvalue()
+    image_bytes is the original upload; it is hashed and handed to the
+    detectors as-is. Results are reused for identical content seen within
+    the cache TTL unless force_rescan is set. The scan waits for an
+    admission slot first; returns None if it was turned away.
+    """
     
-    # Create file hash
-    file_hash = hashlib.md5(img_byte_arr).hexdigest()
+    st.info("🔍 Extracting metadata, running AI detection algorithms and reverse image search...")
+    try:
+        with st.spinner("Waiting for a free scanner..."):
+            admission.acquire(session_id(), priority)
+    except Busy as e:
+        show_busy(e)
+        return None
+    try:
+        with st.spinner("Deepware API, FaceForensics++ and reverse search analyzing..."):
+            results = scan_image(image_bytes, filename, force_rescan=force_rescan)
+    finally:
+        admission.release(session_id())
+    
+    if results["cached"]:
+        st.info("♻️ This image was analyzed before; showing the stored result.")
+    
+    for result in results["detectors"].values():
+        if result.get("error"):
+            st.warning(f"{result['api_name']} unavailable ({result['error']}); using partial results.")
     
-    # Run multiple detection APIs
-    st.info("🔍 Running AI detection algorithms...")
+    return results
+
+# Scan result display
+def show_scan_results(results):
+    """Render the verdict and details of one scan"""
+    st.markdown(f'<div class="result-box {results["result_class"]}">', unsafe_allow_html=True)
+    st.markdown(f"## {results['result_icon']} {results['result_type']}")
+    if results['confidence'] is not None:
+        st.markdown(f"**Confidence Score:** {results['confidence']:.2f}")
+    else:
+        st.markdown("**Confidence Score:** N/A (no detector responded in time)")
+    st.markdown('</div>', unsafe_allow_html=True)
     
+    # Detailed results
     col1, col2 = st.columns(2)
     
     with col1:
-        with st.spinner("Deepware API analyzing..."):
-            deepware_result = MockDetectionAPIs.deepware_detection(img_byte_arr)
+        st.subheader("🤖 AI Detection Results")
+        
+        for detector in results['detectors'].values():
+            st.markdown(f"**{detector['api_name']}:**")
+            if detector.get('error') and detector.get('confidence') is None:
+                st.write(f"- Unavailable: {detector['error']}")
+                continue
+            if detector.get('skipped'):
+                st.write(f"- Skipped: {detector['skipped']}")
+                continue
+            
+            st.write(f"- Fake: {'Yes' if detector['is_fake'] else 'No'}")
+            st.write(f"- Confidence: {detector['confidence']:.2f}")
+            if detector.get('error'):
+                # A clip scored from the frames that did not fail
+                st.write(f"- Partial: {detector['error']}")
+            if detector.get('latency_ms') is not None:
+                st.write(f"- Response time: {detector['latency_ms']:.0f} ms")
+            for key, value in detector['details'].items():
+                st.write(f"- {key.replace('_', ' ').capitalize()}: {value}")
     
     with col2:
-        with st.spinner("FaceForensics++ analyzing..."):
-            faceforensics_result = MockDetectionAPIs.faceforensics_detection(img_byte_arr)
-    
-    # Extract metadata
-    st.info("📊 Extracting image metadata...")
-    metadata = extract_metadata(image)
-    
-    # Reverse image search
-    st.info("🔄 Performing reverse image search...")
-    reverse_results = reverse_image_search(file_hash)
-    
-    # Combine results
-    avg_confidence = (deepware_result["confidence"] + faceforensics_result["confidence"]) / 2
-    is_likely_fake = avg_confidence > 0.6
-    
-    # Determine overall result
-    if avg_confidence > 0.8:
-        result_type = "LIKELY FAKE"
-        result_class = "fake-result"
-        result_icon = "🚨"
-    elif avg_confidence > 0.6:
-        result_type = "SUSPICIOUS"
-        result_class = "suspicious-result"
-        result_icon = "⚠️"
+        st.subheader("📊 Image Metadata")
+        for key, value in results['metadata'].items():
+            if key not in ['MakerNote', 'UserComment']:  # Skip binary data
+                st.write(f"**{key}:** {value}")
+    
+    # Reverse search results
+    st.subheader("🔄 Reverse Image Search Results")
+    for result in results['reverse_search']:
+        st.write(f"**{result['source']}:** {result['matches']} matches (earliest: {result['earliest_date']})")
+        if result.get('similar_scans'):
+            st.dataframe(pd.DataFrame(result['similar_scans']), use_container_width=True)
+    
+    if results.get('frames'):
+        st.subheader("🎞️ Frame Timeline")
+        frames = pd.DataFrame(results['frames'])
+        st.plotly_chart(px.line(frames, x='time_s', y='confidence', markers=True, hover_data=['index', 'result_type'],
+                                title=f"Fused confidence of {len(frames)} sampled frames"), use_container_width=True)
+    
+    if results.get('timings'):
+        with st.expander("⏱️ Stage Timings"):
+            st.dataframe(pd.DataFrame(results['timings'].items(), columns=['stage', 'ms']), use_container_width=True)
+    
+    if results['cached']:
+        st.success("✅ Analysis complete! Result served from cache (tick \"Force re-scan\" to run the detectors again).")
     else:
-        result_type = "LIKELY GENUINE"
-        result_class = "genuine-result"
-        result_icon = "✅"
-    
-    # Store in database
-    conn = sqlite3.connect('powerhex_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO scans (filename, file_hash, scan_result, confidence_score, timestamp, metadata)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (filename, file_hash, result_type, avg_confidence, datetime.now(), json.dumps(metadata)))
-    conn.commit()
-    conn.close()
+        st.success("✅ Analysis complete! Results saved to database.")
+
+# Background scan jobs
+def show_scan_jobs():
+    """Progress and results of this session's background scans"""
+    job_ids = st.session_state.get("scan_jobs", [])
+    if not job_ids:
+        return
+    
+    st.subheader("🗂️ Your Background Scans")
+    jobs = job_status(job_ids)
+    pending = False
+    
+    for job_id in reversed(job_ids):
+        job = jobs.get(job_id)
+        if job is None:
+            continue
+        
+        label = f"#{job_id} {job['filename']} - {job['status']}"
+        if job["status"] == "done":
+            with st.expander(f"{job['result']['result_icon']} {label}: {job['result']['result_type']}",
+                             expanded=job_id == job_ids[-1]):
+                show_scan_results(job["result"])
+        elif job["status"] == "failed":
+            st.error(f"{label}: {job['error']}")
+        else:
+            pending = True
+            st.progress(job["progress"], text=f"{label} ({job['stage'] or 'waiting for a worker'})")
     
-    return {
-        "result_type": result_type,
-        "result_class": result_class,
-        "result_icon": result_icon,
-        "confidence": avg_confidence,
-        "deepware": deepware_result,
-        "faceforensics": faceforensics_result,
-        "metadata": metadata,
-        "reverse_search": reverse_results,
-        "file_hash": file_hash
-    }
+    if pending:
+        # Poll until every job of this session has finished
+        time.sleep(JOB_REFRESH_SECONDS)
+        st.rerun()
+
+# Bulk scanning
+def show_bulk_scanner():
+    """Scan many uploaded images in one go"""
+    st.markdown('<div class="main-header"><h1>📁 Bulk Image Scanner</h1><p>Triage a whole batch of images at once</p></div>', unsafe_allow_html=True)
+    st.caption("For folders or zip archives on the server, use the command line: `python powerhex_bulk.py PATH`")
+    st.caption("Each image counts against this session's scan limits like a single upload; images turned away are listed as errors.")
+    
+    uploaded_files = st.file_uploader(
+        "Choose image or video files",
+        type=UPLOAD_TYPES,
+        accept_multiple_files=True,
+        help="Upload any number of PNG, JPG, or JPEG images, animated GIF/WebP or short video clips"
+    )
+    force_rescan = st.checkbox("Force re-scan", key="bulk_force_rescan", help="Ignore stored results and run all detectors again")
+    # Every image takes an admission slot, so a session never runs more than session_max at once
+    max_workers = max(1, admission.session_max)
+    workers = st.slider("Concurrent scans", 1, max_workers, min(DEFAULT_BULK_WORKERS, max_workers)) if max_workers > 1 else 1
+    
+    if uploaded_files and st.button(f"🔍 Analyze {len(uploaded_files)} Images", type="primary"):
+        progress = st.progress(0.0)
+        status = st.empty()
+        
+        items = [(f.name, f.getvalue) for f in uploaded_files]
+        session = session_id()
+        rows = []
+        counts = {}
+        start = time.monotonic()
+        
+        for done, (name, results, error) in enumerate(bulk_scan(items, workers=workers, force_rescan=force_rescan,
+                                                                    slot=lambda: admission.slot(session)), start=1):
+            key = "ERROR" if error else results["result_type"]
+            counts[key] = counts.get(key, 0) + 1
+            rows.append({
+                "filename": name,
+                "scan_result": key,
+                "confidence_score": results["confidence"] if results else None,
+                "cached": results["cached"] if results else False,
+                "error": error
+            })
+            
+            elapsed = time.monotonic() - start
+            progress.progress(done / len(items))
+            status.text(f"{done}/{len(items)} scanned - {done / elapsed:.2f} images/s")
+        
+        st.success(f"✅ {summarize(counts, len(rows), time.monotonic() - start)}")
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
 
 # Dashboard analytics
 def show_analytics():
     """Display analytics dashboard"""
     st.markdown('<div class="main-header"><h1>📊 Analytics Dashboard</h1></div>', unsafe_allow_html=True)
     
-    conn = sqlite3.connect('powerhex_data.db')
+    # Scan statistics (read from the precomputed dashboard snapshots), cached until the data changes
+    view = analytics_view(data_version("dashboard"))
+    summary = view["summary"]
     
-    # Get scan statistics
-    df_scans = pd.read_sql_query("SELECT * FROM scans", conn)
-    
-    if len(df_scans) > 0:
-        col1, col2, col3, col4 = st.columns(4)
+    if summary["total"] > 0:
+        col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.metric("Total Scans", len(df_scans))
+            st.metric("Total Scans", summary["total"])
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col2:
-            fake_count = len(df_scans[df_scans['scan_result'] == 'LIKELY FAKE'])
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.metric("Fake Images", fake_count)
+            st.metric("Fake Images", summary["fake"])
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col3:
-            flagged_count = len(df_scans[df_scans['flagged'] == True])
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.metric("Flagged Images", flagged_count)
+            st.metric("Flagged Images", summary["flagged"])
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col4:
-            avg_confidence = df_scans['confidence_score'].mean()
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.metric("Avg. Confidence", f"{avg_confidence:.2f}")
+            st.metric("Flag Rate", f"{summary['flag_rate']:.1%}")
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        with col5:
+            avg_confidence = summary["avg_confidence"]
+            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+            st.metric("Avg. Confidence", f"{avg_confidence:.2f}" if avg_confidence is not None else "N/A")
             st.markdown('</div>', unsafe_allow_html=True)
         
         # Charts
@@ -300,34 +426,161 @@ def show_analytics():
         
         with col1:
             # Results distribution
-            result_counts = df_scans['scan_result'].value_counts()
-            fig_pie = px.pie(values=result_counts.values, names=result_counts.index,
-                           title="Detection Results Distribution")
-            st.plotly_chart(fig_pie, use_container_width=True)
+            st.plotly_chart(view["fig_pie"], use_container_width=True)
         
         with col2:
             # Confidence score distribution
-            fig_hist = px.histogram(df_scans, x='confidence_score', nbins=20,
-                                  title="Confidence Score Distribution")
-            st.plotly_chart(fig_hist, use_container_width=True)
+            st.plotly_chart(view["fig_hist"], use_container_width=True)
         
         # Timeline
-        df_scans['timestamp'] = pd.to_datetime(df_scans['timestamp'])
-        daily_scans = df_scans.groupby(df_scans['timestamp'].dt.date).size().reset_index()
-        daily_scans.columns = ['date', 'count']
-        
-        fig_line = px.line(daily_scans, x='date', y='count', title='Daily Scan Activity')
-        st.plotly_chart(fig_line, use_container_width=True)
+        st.plotly_chart(view["fig_line"], use_container_width=True)
         
         # Recent scans table
+        recent = recent_view(data_version())
         st.subheader("Recent Scans")
-        recent_scans = df_scans.tail(10)[['filename', 'scan_result', 'confidence_score', 'timestamp']]
-        st.dataframe(recent_scans, use_container_width=True)
+        st.dataframe(recent["recent"], use_container_width=True)
+        
+        # Detector backend health
+        with st.expander("🔌 Detector Backends"):
+            health = recent["health"]
+            if len(health) > 0:
+                st.caption("Over the last 500 scans")
+                st.dataframe(health, use_container_width=True)
+            st.caption("Circuit breakers in this app process")
+            st.dataframe(pd.DataFrame.from_dict(detector_stats(), orient='index'), use_container_width=True)
+        
+        # Full scan list, including scans moved to the archive by retention
+        with st.expander("🗄️ Export Scan History"):
+            dates = st.date_input("Scanned between (all scans if empty)", value=(), key="history_dates")
+            date_from = dates[0] if len(dates) > 0 else None
+            date_to = dates[1] if len(dates) > 1 else date_from
+            if st.button("Prepare CSV", key="history_prepare"):
+                history = scan_history(date_from, date_to)
+                st.write(f"**{len(history)} scans**")
+                st.download_button("📥 Download CSV", history.to_csv(index=False),
+                                   file_name="powerhex_scan_history.csv", mime="text/csv")
     
     else:
         st.info("No scan data available yet. Upload and scan some images to see analytics!")
+
+# Metadata search
+def show_metadata_search():
+    """Find scans by EXIF and image-info tags"""
+    st.markdown('<div class="main-header"><h1>🔎 Metadata Search</h1><p>Investigate scans by camera, software and other image tags</p></div>', unsafe_allow_html=True)
+    
+    version = data_version()
+    key_options = metadata_keys_view(version)
+    if not key_options:
+        st.info("No metadata stored yet. Upload and scan some images first!")
+        return
+    
+    # Value frequency of one tag, e.g. which camera models show up
+    st.subheader("Tag Frequency")
+    frequency_key = st.selectbox("Tag", key_options,
+                                 index=key_options.index("Model") if "Model" in key_options else 0)
+    st.plotly_chart(metadata_frequency_view(frequency_key, version), use_container_width=True)
+    
+    # Filters are combined with AND and evaluated in SQL
+    st.subheader("Filter Scans")
+    filters = []
+    for row in range(METADATA_FILTER_ROWS):
+        col1, col2, col3 = st.columns([2, 1, 2])
+        with col1:
+            key = st.selectbox("Tag", [""] + key_options, key=f"metadata_key_{row}")
+        with col2:
+            operator = st.selectbox("Operator", list(METADATA_OPERATORS), key=f"metadata_op_{row}")
+        with col3:
+            value = st.text_input("Value", key=f"metadata_value_{row}")
+        if key and (value or operator == "exists"):
+            filters.append((key, operator, value))
+    
+    if filters:
+        try:
+            matches = metadata_search_view(tuple(filters), version)
+        except ValueError:
+            st.error("❌ Numeric comparisons need a number.")
+            return
+        st.write(f"**{len(matches)} matching scans** (newest first, at most 200)")
+        st.dataframe(matches, use_container_width=True)
+
+# Operations
+def show_operations():
+    """Where scan time goes, per stage and per detector"""
+    st.markdown('<div class="main-header"><h1>⚙️ Operations</h1><p>Pipeline latency by stage and detector</p></div>', unsafe_allow_html=True)
     
-    conn.close()
+    depth = job_queue_depth()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Queued Jobs", depth.get("queued", 0))
+    with col2:
+        st.metric("Running Jobs", depth.get("running", 0))
+    with col3:
+        lookups = result_cache.hits + result_cache.misses
+        st.metric("Cache Hit Rate", f"{result_cache.hits / lookups:.0%}" if lookups else "N/A")
+    with col4:
+        st.metric("Cached Results", len(result_cache))
+    
+    # Admission control of this app process (see powerhex_admission.py)
+    control = admission.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Running Scans", f"{control['in_flight']}/{control['max_concurrent']}")
+    with col2:
+        st.metric("Waiting Scans", f"{control['queued']}/{control['queue_size']}")
+    with col3:
+        st.metric("Admitted", sum(control["admitted"].values()))
+    with col4:
+        st.metric("Rejected", sum(control["rejected"].values()))
+    if any(control["rejected"].values()):
+        st.caption("Rejections: " + ", ".join(f"{reason.replace('_', ' ')} {count}"
+                                               for reason, count in control["rejected"].items() if count))
+    
+    # Stored per-scan timings cover every process, including background workers
+    st.subheader("Stage Latency (last 1000 scans)")
+    view = operations_view(data_version())
+    stages = view["stages"]
+    if len(stages) > 0:
+        st.plotly_chart(view["fig_stages"], use_container_width=True)
+        st.dataframe(stages, use_container_width=True, hide_index=True)
+    else:
+        st.info("No timed scans yet.")
+    
+    st.subheader("Detector Latency (last 500 scans)")
+    health = view["health"]
+    if len(health) > 0:
+        st.dataframe(health, use_container_width=True, hide_index=True)
+    
+    # Histograms of this app process only
+    with st.expander("📈 This Process"):
+        st.caption("Stages")
+        st.dataframe(pd.DataFrame.from_dict(metrics.summary(STAGE_METRIC, "stage"), orient='index'), use_container_width=True)
+        st.caption("Detectors")
+        st.dataframe(pd.DataFrame.from_dict(metrics.summary(DETECTOR_METRIC, "detector"), orient='index'), use_container_width=True)
+        st.caption("Prometheus text (also served at /metrics by powerhex_api.py)")
+        st.code(metrics.prometheus_text(), language="text")
+    
+    # Database size and the retention policies (see powerhex_retention.py)
+    st.subheader("Storage & Retention")
+    storage = storage_stats()
+    archive = archive_stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Database Size", f"{storage['size_bytes'] / 2**20:.1f} MB")
+    with col2:
+        st.metric("Free Space", f"{storage['free_bytes'] / 2**20:.1f} MB")
+    with col3:
+        st.metric("Archive Size", f"{archive['size_bytes'] / 2**20:.1f} MB", f"{archive['partitions']} partitions",
+                  delta_color="off")
+    st.caption(f"Full detail kept for {RETENTION_FULL_DAYS} days, scans archived after {RETENTION_ARCHIVE_DAYS} days "
+               f"(0 = never). Incremental vacuum: {'on' if storage['incremental_vacuum'] else 'off'}.")
+    if last_run:
+        st.caption(f"Last background run: {last_run['started_at']:%Y-%m-%d %H:%M:%S}"
+                   + (f", failed: {last_run['error']}" if last_run.get('error') else ""))
+    if st.button("🧹 Run Retention Now"):
+        with st.spinner("Compacting and archiving..."):
+            st.json(run_retention())
+    st.caption(f"Dashboard snapshots: {pending_scan_changes()} changes waiting for the rollup worker "
+               + (f"(runs every {ROLLUP_INTERVAL:g} s)." if ROLLUP_INTERVAL > 0 else "(background thread off)."))
 
 # Educational section
 def show_education():
@@ -405,18 +658,68 @@ def show_education():
         
         if st.button("Submit Quiz"):
             # Store quiz results
-            conn = sqlite3.connect('powerhex_data.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO educational_stats (quiz_taken, score, timestamp)
-                VALUES (?, ?, ?)
-            ''', (True, score, datetime.now()))
-            conn.commit()
-            conn.close()
+            insert_quiz_result(score, datetime.now())
             
             st.success(f"Quiz completed! Your score: {score}/{len(questions)}")
 
 # Reporting system
+def report_filters(key, with_reason):
+    """Filter widgets for a report list; returns scans_page keyword arguments"""
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        filename = st.text_input("Filename contains", key=f"{key}_filename")
+    with col2:
+        result = st.selectbox("Result", [""] + SCAN_RESULTS, key=f"{key}_result")
+    with col3:
+        dates = st.date_input("Scanned between", value=(), key=f"{key}_dates")
+    with col4:
+        reason = st.selectbox("Reason", [""] + REPORT_REASONS, key=f"{key}_reason") if with_reason else ""
+    
+    date_from = dates[0] if len(dates) > 0 else None
+    date_to = dates[1] if len(dates) > 1 else date_from
+    return {"filename": filename, "result": result, "reason": reason, "date_from": date_from, "date_to": date_to}
+
+def report_page(key, flagged, filters):
+    """Fetch the current page of a report list, with Previous/Next buttons.
+
+    The page cursors (smallest id of each earlier page) live in session
+    state and are reset whenever the filters change.
+    """
+    state = st.session_state.setdefault(key, {"filters": None, "cursors": [None]})
+    if state["filters"] != filters:
+        state.update(filters=filters, cursors=[None])
+    
+    page = scans_page(flagged, before_id=state["cursors"][-1], **filters)
+    
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("⬅️ Previous", key=f"{key}_previous", disabled=len(state["cursors"]) == 1):
+            state["cursors"].pop()
+            st.rerun()
+    with col2:
+        if st.button("Next ➡️", key=f"{key}_next", disabled=len(page) < REPORT_PAGE_SIZE):
+            state["cursors"].append(int(page['id'].min()))
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(state['cursors'])}, {REPORT_PAGE_SIZE} scans per page, newest first")
+    
+    return page
+
+def select_rows(page, key, columns):
+    """Show a page with a checkbox per row; returns the ids of the checked rows"""
+    table = page[columns].copy()
+    table.insert(0, "select", False)
+    edited = st.data_editor(
+        table,
+        # A new page (or the same page after an update) starts unchecked
+        key=f"{key}_editor_{hash(tuple(page['id']))}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=columns,
+        column_config={"select": st.column_config.CheckboxColumn("Select")}
+    )
+    return edited.loc[edited["select"], "id"].tolist()
+
 def show_reporting():
     """Community reporting interface"""
     st.markdown('<div class="main-header"><h1>🚩 Report Suspicious Images</h1></div>', unsafe_allow_html=True)
@@ -426,35 +729,20 @@ def show_reporting():
     with tab1:
         st.subheader("Report a Suspicious Image")
         
-        # Get scan history for reporting
-        conn = sqlite3.connect('powerhex_data.db')
-        df_scans = pd.read_sql_query("SELECT id, filename, scan_result FROM scans WHERE flagged = FALSE", conn)
-        conn.close()
+        # Scan history is browsed one page at a time, filtered in SQL
+        filters = report_filters("report", with_reason=False)
+        df_scans = report_page("report_pages", False, filters)
         
         if len(df_scans) > 0:
-            selected_scan = st.selectbox("Select an image to report:", 
-                                       options=df_scans['id'].tolist(),
-                                       format_func=lambda x: df_scans[df_scans['id']==x]['filename'].iloc[0])
+            selected_scans = select_rows(df_scans, "report", ['id', 'filename', 'scan_result', 'confidence_score', 'timestamp'])
             
-            reason = st.selectbox("Reason for reporting:", [
-                "Suspected deepfake",
-                "Identity theft",
-                "Misinformation",
-                "Inappropriate content",
-                "Other"
-            ])
+            reason = st.selectbox("Reason for reporting:", REPORT_REASONS)
             
             additional_info = st.text_area("Additional information (optional):")
             
-            if st.button("Submit Report"):
+            if st.button(f"Submit Report ({len(selected_scans)} selected)", disabled=not selected_scans):
                 # Update database
-                conn = sqlite3.connect('powerhex_data.db')
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE scans SET flagged = TRUE, flag_reason = ? WHERE id = ?
-                ''', (f"{reason}: {additional_info}", selected_scan))
-                conn.commit()
-                conn.close()
+                flag_scans(selected_scans, f"{reason}: {additional_info}")
                 
                 st.success("Report submitted successfully! ✅")
                 st.rerun()
@@ -464,40 +752,69 @@ def show_reporting():
     with tab2:
         st.subheader("Flagged Images Review")
         
-        conn = sqlite3.connect('powerhex_data.db')
-        df_flagged = pd.read_sql_query("SELECT * FROM scans WHERE flagged = TRUE", conn)
-        conn.close()
+        filters = report_filters("review", with_reason=True)
+        df_flagged = report_page("review_pages", True, filters)
         
         if len(df_flagged) > 0:
-            for _, row in df_flagged.iterrows():
-                with st.expander(f"🚩 {row['filename']} - {row['scan_result']}"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write(f"**Confidence:** {row['confidence_score']:.2f}")
-                        st.write(f"**Timestamp:** {row['timestamp']}")
-                    with col2:
-                        st.write(f"**Reason:** {row['flag_reason']}")
-                        if st.button(f"Resolve Report", key=f"resolve_{row['id']}"):
-                            # Update database to remove flag
-                            conn = sqlite3.connect('powerhex_data.db')
-                            cursor = conn.cursor()
-                            cursor.execute('UPDATE scans SET flagged = FALSE WHERE id = ?', (row['id'],))
-                            conn.commit()
-                            conn.close()
-                            st.success("Report resolved!")
-                            st.rerun()
+            selected_reports = select_rows(df_flagged, "review", ['id', 'filename', 'scan_result', 'confidence_score', 'timestamp', 'flag_reason'])
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button(f"✅ Resolve Selected ({len(selected_reports)})", disabled=not selected_reports):
+                    resolved = resolve_reports(selected_reports)
+                    st.success(f"{resolved} reports resolved!")
+                    st.rerun()
+            with col2:
+                # Resolving every match can clear far more than the visible page, so
+                # show the count and ask again; changing the filters drops the request
+                if st.button("✅ Resolve All Matching Filters"):
+                    st.session_state["review_resolve_all"] = (filters, count_matching_reports(**filters))
+                pending = st.session_state.get("review_resolve_all")
+                if pending and pending[0] == filters:
+                    st.warning(f"This resolves all {pending[1]} reports matching the filters, not only this page.")
+                    if st.button(f"Yes, resolve {pending[1]} reports", key="review_resolve_all_confirm"):
+                        del st.session_state["review_resolve_all"]
+                        resolved = resolve_matching_reports(**filters)
+                        st.success(f"{resolved} reports resolved!")
+                        st.rerun()
+                    if st.button("Cancel", key="review_resolve_all_cancel"):
+                        del st.session_state["review_resolve_all"]
+                        st.rerun()
         else:
             st.info("No flagged images to review.")
+        
+        # Moderator re-scans skip the rate limit and go ahead of queued uploads,
+        # so they need the moderator token
+        with st.expander("🔁 Re-scan a Reported Image"):
+            if not MODERATOR_TOKEN:
+                st.info("Moderator re-scans are off. Set POWERHEX_MODERATOR_TOKEN to enable them.")
+            else:
+                token = st.text_input("Moderator token", type="password", key="moderator_token")
+                if token and not is_moderator(token):
+                    st.error("❌ Wrong moderator token.")
+                elif token:
+                    st.caption("Scans keep no image data, so upload the reported file again. All detectors run "
+                               "again, ahead of ordinary scans waiting in the queue.")
+                    rescan_file = st.file_uploader("Reported image or video", type=UPLOAD_TYPES, key="rescan_upload")
+                    if rescan_file is not None and st.button("🔁 Re-scan", key="rescan_button"):
+                        results = perform_detection(rescan_file.name, rescan_file.getvalue(), force_rescan=True,
+                                                    priority=PRIORITY_MODERATOR)
+                        if results is not None:
+                            show_scan_results(results)
 
 # Main application
 def main():
-    init_database()
+    setup_database()
+    ensure_local_workers()
     
     # Sidebar navigation
     st.sidebar.markdown("## 🛡️ PowerHEX Navigation")
     page = st.sidebar.selectbox("Choose a page:", [
         "🔍 Image Scanner",
+        "📁 Bulk Scanner",
         "📊 Analytics Dashboard", 
+        "🔎 Metadata Search",
+        "⚙️ Operations",
         "🎓 Education Center",
         "🚩 Reporting System"
     ])
@@ -509,68 +826,66 @@ def main():
         # File upload
         st.markdown('<div class="upload-section">', unsafe_allow_html=True)
         uploaded_file = st.file_uploader(
-            "Choose an image file", 
-            type=['png', 'jpg', 'jpeg'],
-            help="Upload PNG, JPG, or JPEG images for analysis"
+            "Choose an image or video file", 
+            type=UPLOAD_TYPES,
+            help="Upload PNG, JPG, or JPEG images, animated GIF/WebP or short video clips for analysis"
         )
         st.markdown('</div>', unsafe_allow_html=True)
         
+        upload = None
         if uploaded_file is not None:
-            # Display uploaded image
-            image = Image.open(uploaded_file)
-            
+            try:
+                upload = session_upload(uploaded_file.getvalue())
+            except ImageTooLargeError as e:
+                st.error(f"❌ {e}")
+            except UnidentifiedImageError as e:
+                st.error(f"❌ This file is not a readable image or video. {e}")
+        
+        if upload is not None:
+            # Display a downscaled preview; the full image is never decoded here
             col1, col2 = st.columns([1, 2])
             
             with col1:
-                st.image(image, caption=f"Uploaded: {uploaded_file.name}", use_column_width=True)
+                if isinstance(upload, Clip) and upload.kind == "video":
+                    st.video(uploaded_file.getvalue())
+                else:
+                    st.image(upload.preview(), caption=f"Uploaded: {uploaded_file.name}", use_column_width=True)
             
             with col2:
-                st.info(f"**File:** {uploaded_file.name}\n**Size:** {len(uploaded_file.getvalue())} bytes\n**Dimensions:** {image.size[0]} x {image.size[1]}")
+                st.info(f"**File:** {uploaded_file.name}\n**Size:** {len(uploaded_file.getvalue())} bytes\n**Dimensions:** {upload.size[0]} x {upload.size[1]}")
+                if isinstance(upload, Clip):
+                    clip_info = upload.metadata()
+                    st.info(f"**{clip_info['Media Type'].capitalize()}:** {clip_info.get('Frame Count', '?')} frames"
+                            + (f", {clip_info['Duration (s)']} s" if 'Duration (s)' in clip_info else "")
+                            + " - sampled frames are analyzed and combined into one verdict")
+            
+            force_rescan = st.checkbox("Force re-scan", help="Ignore any stored result for this image and run all detectors again")
+            run_in_background = st.checkbox("Run in background", value=True,
+                                            help="Queue the scan for a background worker instead of waiting on this page")
             
             # Perform detection
             if st.button("🔍 Analyze Image", type="primary"):
-                results = perform_detection(image, uploaded_file.name)
-                
-                # Display results
-                st.markdown(f'<div class="result-box {results["result_class"]}">', unsafe_allow_html=True)
-                st.markdown(f"## {results['result_icon']} {results['result_type']}")
-                st.markdown(f"**Confidence Score:** {results['confidence']:.2f}")
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                # Detailed results
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.subheader("🤖 AI Detection Results")
-                    
-                    # Deepware results
-                    st.markdown("**Deepware API:**")
-                    st.write(f"- Fake: {'Yes' if results['deepware']['is_fake'] else 'No'}")
-                    st.write(f"- Confidence: {results['deepware']['confidence']:.2f}")
-                    st.write(f"- Processing time: {results['deepware']['details']['processing_time']}")
-                    
-                    # FaceForensics results
-                    st.markdown("**FaceForensics++:**")
-                    st.write(f"- Fake: {'Yes' if results['faceforensics']['is_fake'] else 'No'}")
-                    st.write(f"- Confidence: {results['faceforensics']['confidence']:.2f}")
-                    st.write(f"- Neural traces: {'Detected' if results['faceforensics']['details']['neural_network_traces'] else 'None'}")
-                
-                with col2:
-                    st.subheader("📊 Image Metadata")
-                    for key, value in results['metadata'].items():
-                        if key not in ['MakerNote', 'UserComment']:  # Skip binary data
-                            st.write(f"**{key}:** {value}")
-                
-                # Reverse search results
-                st.subheader("🔄 Reverse Image Search Results")
-                for result in results['reverse_search']:
-                    st.write(f"**{result['source']}:** {result['matches']} matches (earliest: {result['earliest_date']})")
-                
-                st.success("✅ Analysis complete! Results saved to database.")
+                if run_in_background:
+                    submit_background_scan(uploaded_file.name, uploaded_file.getvalue(), force_rescan=force_rescan)
+                else:
+                    results = perform_detection(uploaded_file.name, uploaded_file.getvalue(), force_rescan=force_rescan)
+                    if results is not None:
+                        show_scan_results(results)
+        
+        show_scan_jobs()
+    
+    elif page == "📁 Bulk Scanner":
+        show_bulk_scanner()
     
     elif page == "📊 Analytics Dashboard":
         show_analytics()
     
+    elif page == "🔎 Metadata Search":
+        show_metadata_search()
+    
+    elif page == "⚙️ Operations":
+        show_operations()
+    
     elif page == "🎓 Education Center":
         show_education()
     
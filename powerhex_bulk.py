@@ -0,0 +1,172 @@
+"""Bulk scanning for folders, zip archives and multi-file uploads.
+
+Usage:
+    python powerhex_bulk.py PATH [PATH ...] [--workers N] [--batch-size N] [--force] [--output results.ndjson]
+
+PATH may be a directory (scanned recursively) or a .zip archive. Videos and
+animated GIF/WebP files are scanned as clips (see powerhex_video).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+
+from powerhex_cache import result_cache
+from powerhex_db import init_database
+from powerhex_detectors import DEFAULT_POLICY, DETECTOR_WORKERS, DETECTORS
+from powerhex_pipeline import analyze_image, is_cacheable, save_scans
+from powerhex_video import ANIMATION_EXTENSIONS, VIDEO_EXTENSIONS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SCAN_EXTENSIONS = IMAGE_EXTENSIONS + ANIMATION_EXTENSIONS + VIDEO_EXTENSIONS
+
+# Each scan keeps every remote detector plus reverse search busy on the
+# shared detector pool, so more scan workers than this only queue up behind
+# it; the local analyzers (cost <= fast_cost) take milliseconds and are not counted
+SLOW_DETECTORS = sum(1 for backend in DETECTORS.values() if backend.cost > DEFAULT_POLICY.fast_cost)
+DEFAULT_BULK_WORKERS = max(1, DETECTOR_WORKERS // (SLOW_DETECTORS + 1))
+DEFAULT_BATCH_SIZE = 50
+
+def iter_directory(path):
+    """Yield (name, loader) for every image or clip below a directory"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(SCAN_EXTENSIONS):
+                full_path = os.path.join(root, filename)
+                yield os.path.relpath(full_path, path), lambda p=full_path: open(p, 'rb').read()
+
+def _failing_loader(error):
+    def loader():
+        raise error
+    return loader
+
+def iter_zip(path):
+    """Yield (name, loader) for every image or clip inside a zip archive.
+
+    Each member is read when it is yielded, while the archive is still
+    open, and the archive is closed once the generator finishes or is
+    dropped. bulk_scan only pulls the next item when a worker frees up, so
+    few members are in memory at once. A member that cannot be read is
+    yielded with a loader that raises the error.
+    """
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(SCAN_EXTENSIONS):
+                continue
+            try:
+                data = archive.read(info)
+            except Exception as e:
+                yield info.filename, _failing_loader(e)
+            else:
+                yield info.filename, lambda data=data: data
+
+def iter_sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_directory(path)
+        elif zipfile.is_zipfile(path):
+            yield from iter_zip(path)
+        elif path.lower().endswith(SCAN_EXTENSIONS):
+            yield os.path.basename(path), lambda p=path: open(p, 'rb').read()
+
+def _scan_one(name, loader, force_rescan, slot=None):
+    try:
+        with slot() if slot is not None else nullcontext():
+            return name, analyze_image(loader(), name, force_rescan=force_rescan), None
+    except Exception as e:
+        return name, None, str(e)
+
+def bulk_scan(items, workers=DEFAULT_BULK_WORKERS, batch_size=DEFAULT_BATCH_SIZE, force_rescan=False, slot=None):
+    """Scan (name, loader) items on a worker pool, yielding (name, results, error) as each finishes.
+
+    Items are only taken from ``items`` as workers free up, at most two per
+    worker in flight, and images are read no earlier than that, so memory
+    stays bounded however many items there are. Fresh results are inserted in batches of batch_size rows, one
+    transaction per batch. ``slot()``, if given, returns a context manager
+    each image is read and scanned in, e.g. an admission slot; an image it
+    rejects is reported with the error.
+    """
+    items = iter(items)
+    batch = []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="powerhex-bulk") as pool:
+        pending = set()
+
+        def submit_next():
+            for name, loader in items:
+                pending.add(pool.submit(_scan_one, name, loader, force_rescan, slot))
+                return True
+            return False
+
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, results, error = future.result()
+                    if results is not None and not results["cached"]:
+                        batch.append(results)
+                        # Later duplicates in the same run hit the cache
+                        if is_cacheable(results):
+                            result_cache.put(results["file_hash"], results, results["timestamp"].timestamp())
+                        if len(batch) >= batch_size:
+                            save_scans(batch)
+                            batch = []
+                    submit_next()
+                    yield name, results, error
+        finally:
+            save_scans(batch)
+
+def summarize(counts, done, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    parts = ", ".join(f"{key}: {value}" for key, value in sorted(counts.items()))
+    return f"{done} images in {elapsed:.1f}s ({rate:.2f} images/s) - {parts}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a folder or zip archive of images with PowerHEX")
+    parser.add_argument("paths", nargs="+", help="directories, .zip archives or image files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BULK_WORKERS, help="concurrent scans")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per database transaction")
+    parser.add_argument("--force", action="store_true", help="ignore cached results and re-run all detectors")
+    parser.add_argument("--output", help="write one JSON line per image to this file")
+    args = parser.parse_args(argv)
+
+    init_database()
+    output = open(args.output, "w") if args.output else None
+    counts = {}
+    done = 0
+    start = time.monotonic()
+
+    try:
+        for name, results, error in bulk_scan(iter_sources(args.paths), args.workers, args.batch_size, args.force):
+            done += 1
+            key = "ERROR" if error else results["result_type"]
+            counts[key] = counts.get(key, 0) + 1
+
+            if output:
+                record = {"filename": name, "error": error}
+                if results is not None:
+                    record.update(result=results["result_type"], confidence=results["confidence"],
+                                  file_hash=results["file_hash"], cached=results["cached"])
+                output.write(json.dumps(record) + "\n")
+
+            elapsed = time.monotonic() - start
+            print(f"\r[{done}] {done / elapsed:.2f} images/s - {name}"[:120].ljust(120), end="", file=sys.stderr)
+    finally:
+        if output:
+            output.close()
+
+    print(file=sys.stderr)
+    print(summarize(counts, done, time.monotonic() - start))
+    return 1 if counts.get("ERROR") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Result cache settings
+CACHE_MAX_ENTRIES = int(os.environ.get("POWERHEX_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("POWERHEX_CACHE_TTL", str(7 * 24 * 3600)))
+
+def content_hash(data):
+    """Hex digest identifying an upload by its original bytes (BLAKE2b, 128-bit)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class ResultCache:
+    """Bounded, thread-safe LRU cache of scan results keyed by content hash.
+
+    Misses fall through to ``loader(key, max_age)``, which should return
+    ``(stored_at, value)`` for a persisted result no older than ``max_age``
+    seconds, or ``None``. ``stored_at`` is a Unix timestamp.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, loader=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if absent or expired"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        loaded = self.loader(key, self.ttl_seconds) if self.loader else None
+        if loaded is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        stored_at, value = loaded
+        self.put(key, value, stored_at)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, stored_at=None):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (stored_at if stored_at is not None else time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Process-wide cache shared by all sessions; the app attaches its SQLite loader
+result_cache = ResultCache()
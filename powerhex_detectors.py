@@ -0,0 +1,552 @@
+import io
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image
+from powerhex_forensics import error_level_analysis, jpeg_compression_history, noise_spectrum
+from powerhex_fusion import load_policy
+from powerhex_ingest import open_image
+from powerhex_metrics import DETECTOR_METRIC, metrics, timed
+
+# Detector orchestration settings
+DETECTOR_WORKERS = int(os.environ.get("POWERHEX_DETECTOR_WORKERS", "8"))
+DEFAULT_DETECTOR_TIMEOUT = float(os.environ.get("POWERHEX_DETECTOR_TIMEOUT", "5"))
+# In-process forensic analyzers (see powerhex_forensics); "0" leaves them out
+LOCAL_DETECTORS = os.environ.get("POWERHEX_LOCAL_DETECTORS", "1") != "0"
+LOCAL_DETECTOR_COST = 0.05
+
+# Shared, bounded pool for every detector call in this process
+_executor = ThreadPoolExecutor(max_workers=DETECTOR_WORKERS, thread_name_prefix="powerhex-detector")
+
+# Mock AI Detection APIs (simulating real APIs for demo)
+class MockDetectionAPIs:
+    @staticmethod
+    def deepware_detection(image_data):
+        """Simulate Deepware API response"""
+        # Simulate processing time
+        start = time.perf_counter()
+        time.sleep(2)
+
+        # Random but realistic results for demo
+        confidence = random.uniform(0.15, 0.95)
+        is_fake = confidence > 0.6
+
+        return {
+            "is_fake": is_fake,
+            "confidence": confidence,
+            "api_name": "Deepware API",
+            "details": {
+                "face_detected": True,
+                "manipulation_type": "deepfake" if is_fake else "none",
+                "processing_time": f"{time.perf_counter() - start:.1f}s"
+            }
+        }
+
+    @staticmethod
+    def faceforensics_detection(image_data):
+        """Simulate FaceForensics detection"""
+        time.sleep(1.5)
+
+        confidence = random.uniform(0.2, 0.9)
+        is_fake = confidence > 0.55
+
+        return {
+            "is_fake": is_fake,
+            "confidence": confidence,
+            "api_name": "FaceForensics++",
+            "details": {
+                "compression_artifacts": random.choice([True, False]),
+                "temporal_consistency": random.choice(["consistent", "inconsistent"]),
+                "neural_network_traces": is_fake
+            }
+        }
+
+# Reverse image search simulation
+def reverse_image_search(image_hash):
+    """Simulate reverse image search"""
+    time.sleep(1)
+
+    # Mock results
+    results = [
+        {"source": "TinEye", "matches": random.randint(0, 15), "earliest_date": "2023-03-15"},
+        {"source": "Google Images", "matches": random.randint(0, 25), "earliest_date": "2023-01-20"}
+    ]
+
+    return results
+
+class ImagePayload:
+    """The uploaded file as detectors see it.
+
+    Backends that accept raw bytes get a zero-copy ``memoryview`` of the
+    original upload. A PNG rendition is only encoded, once, when a backend
+    that needs it asks for it. Local analyzers share one parsed upload
+    (``powerhex_ingest.UploadedImage``) and its cached decodes.
+    """
+
+    def __init__(self, data, image=None, timer=None, upload=None):
+        self.data = data
+        self.view = memoryview(data)
+        self.timer = timer
+        self._image = image
+        self._upload = upload
+        self._png = None
+        self._lock = threading.Lock()
+
+    def upload(self):
+        with self._lock:
+            if self._upload is None:
+                self._upload = open_image(self.data)
+            return self._upload
+
+    def png(self):
+        with self._lock:
+            if self._png is None:
+                with self.timer.stage("png_encode") if self.timer else timed("png_encode"):
+                    image = self._image if self._image is not None else Image.open(io.BytesIO(self.data))
+                    buffer = io.BytesIO()
+                    image.save(buffer, format='PNG')
+                    self._png = buffer.getvalue()
+            return self._png
+
+# HTTP backend settings
+HTTP_RETRIES = int(os.environ.get("POWERHEX_HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("POWERHEX_HTTP_BACKOFF", "0.3"))
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+BREAKER_FAILURES = int(os.environ.get("POWERHEX_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("POWERHEX_BREAKER_RESET_SECONDS", "30"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling a backend after repeated failures until a cool-down has passed.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast. Once ``reset_timeout`` seconds have passed a single
+    trial call is let through; success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class BackendStats:
+    """Call count, error count and latency of one backend in this process"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=None):
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            if error is not None:
+                self.errors += 1
+                self.last_error = error
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "error_rate": self.errors / self.calls if self.calls else 0.0,
+                "avg_latency_ms": self.total_latency / self.calls * 1000 if self.calls else None,
+                "last_error": self.last_error
+            }
+
+class DetectorBackend:
+    """A detection service plugged into the registry.
+
+    Subclasses implement ``detect(image_data)`` and return the common result
+    schema: ``is_fake``, ``confidence`` (0-1), ``api_name`` and ``details``.
+    ``input_kind`` is "raw" (memoryview of the upload), "png" or "upload"
+    (the parsed ``UploadedImage``, for local analyzers). ``cost`` is
+    the expected seconds (or spend) per call; cheaper detectors run first.
+    Backends that can bound their own running time (retries, socket
+    timeouts) override ``detect_within(image_data, deadline)`` as well.
+    """
+
+    def __init__(self, api_name, timeout=DEFAULT_DETECTOR_TIMEOUT, input_kind="raw", cost=1.0):
+        self.api_name = api_name
+        self.timeout = timeout
+        self.input_kind = input_kind
+        self.cost = cost
+        self.breaker = CircuitBreaker()
+        self.stats = BackendStats()
+
+    def detect(self, image_data):
+        raise NotImplementedError
+
+    def detect_within(self, image_data, deadline):
+        """detect() for a call whose result is only used until `deadline` (time.monotonic())"""
+        return self.detect(image_data)
+
+    def run(self, payload, deadline=None):
+        """Call the backend through its circuit breaker, recording latency and errors.
+
+        ``deadline`` (time.monotonic()) defaults to ``timeout`` from now; a
+        call that only starts after it, having waited for a pool thread,
+        is not made.
+        """
+        deadline = deadline if deadline is not None else time.monotonic() + self.timeout
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"{self.api_name} not started before its deadline")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.api_name} circuit open after repeated failures")
+
+        if self.input_kind == "png":
+            image_data = payload.png()
+        elif self.input_kind == "upload":
+            image_data = payload.upload()
+        else:
+            image_data = payload.view
+        start = time.perf_counter()
+        try:
+            result = self.detect_within(image_data, deadline)
+        except Exception as e:
+            self.stats.record(time.perf_counter() - start, error=str(e))
+            self.breaker.record_failure()
+            raise
+
+        latency = time.perf_counter() - start
+        self.stats.record(latency)
+        metrics.observe(DETECTOR_METRIC, latency, detector=self.api_name)
+        self.breaker.record_success()
+        return dict(result, latency_ms=round(latency * 1000, 1))
+
+class MockBackend(DetectorBackend):
+    """Local stand-in backed by one of the MockDetectionAPIs functions"""
+
+    def __init__(self, api_name, fn, **kwargs):
+        super().__init__(api_name, **kwargs)
+        self.fn = fn
+
+    def detect(self, image_data):
+        return self.fn(image_data)
+
+class LocalBackend(DetectorBackend):
+    """In-process analyzer from powerhex_forensics, run on the parsed upload"""
+
+    def __init__(self, api_name, fn, cost=LOCAL_DETECTOR_COST, **kwargs):
+        super().__init__(api_name, input_kind="upload", cost=cost, **kwargs)
+        self.fn = fn
+
+    def detect(self, upload):
+        return self.fn(upload, self.api_name)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Process-wide requests session with keep-alive pooling; HTTPDetectorBackend does its own retries"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=DETECTOR_WORKERS)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+class HTTPDetectorBackend(DetectorBackend):
+    """A detection service reached over HTTP.
+
+    The image is POSTed as multipart field ``image``. The JSON response must
+    carry a 0-1 score under ``confidence_key``; ``is_fake`` and ``details``
+    are used when present. Connection errors, timeouts and
+    HTTP_RETRY_STATUSES are retried up to HTTP_RETRIES times with
+    exponential backoff (or the server's Retry-After), all within the
+    call's deadline: each attempt's timeout is the time left, and no retry
+    starts once the backoff would reach it.
+    """
+
+    def __init__(self, api_name, url, api_key=None, confidence_key="confidence", fake_threshold=0.5, **kwargs):
+        super().__init__(api_name, **kwargs)
+        self.url = url
+        self.api_key = api_key
+        self.confidence_key = confidence_key
+        self.fake_threshold = fake_threshold
+
+    def detect(self, image_data):
+        return self.detect_within(image_data, time.monotonic() + self.timeout)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            return max(float(retry_after), 0)
+        except (TypeError, ValueError):
+            return HTTP_BACKOFF * 2 ** attempt
+
+    def detect_within(self, image_data, deadline):
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        data = bytes(image_data)
+        for attempt in range(HTTP_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{self.api_name} deadline passed after {attempt} attempts")
+            try:
+                response = get_http_session().post(
+                    self.url,
+                    files={"image": ("upload", data)},
+                    headers=headers,
+                    timeout=remaining
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                delay = self._backoff(attempt)
+                if attempt == HTTP_RETRIES or time.monotonic() + delay >= deadline:
+                    raise
+            else:
+                if response.status_code not in HTTP_RETRY_STATUSES:
+                    break
+                delay = self._backoff(attempt, response)
+                if attempt == HTTP_RETRIES or time.monotonic() + delay >= deadline:
+                    break
+            time.sleep(delay)
+
+        response.raise_for_status()
+        body = response.json()
+
+        confidence = float(body[self.confidence_key])
+        return {
+            "is_fake": bool(body.get("is_fake", confidence > self.fake_threshold)),
+            "confidence": confidence,
+            "api_name": self.api_name,
+            "details": body.get("details", {})
+        }
+
+# Detector registry: key -> backend
+DETECTORS = {}
+
+def register_detector(key, backend):
+    DETECTORS[key] = backend
+
+def unregister_detector(key):
+    DETECTORS.pop(key, None)
+
+def backend_from_env(key, api_name, default):
+    """An HTTP backend when POWERHEX_<KEY>_URL is set, otherwise the given default.
+
+    POWERHEX_<KEY>_API_KEY, _TIMEOUT, _INPUT ("raw" or "png") and _COST configure it further.
+    """
+    prefix = f"POWERHEX_{key.upper()}_"
+    url = os.environ.get(prefix + "URL")
+    if not url:
+        return default
+    return HTTPDetectorBackend(
+        api_name,
+        url,
+        api_key=os.environ.get(prefix + "API_KEY"),
+        timeout=float(os.environ.get(prefix + "TIMEOUT", DEFAULT_DETECTOR_TIMEOUT)),
+        input_kind=os.environ.get(prefix + "INPUT", "raw"),
+        cost=float(os.environ.get(prefix + "COST", "1.0"))
+    )
+
+register_detector("deepware", backend_from_env(
+    "deepware", "Deepware API", MockBackend("Deepware API", MockDetectionAPIs.deepware_detection, cost=2.0)
+))
+register_detector("faceforensics", backend_from_env(
+    "faceforensics", "FaceForensics++", MockBackend("FaceForensics++", MockDetectionAPIs.faceforensics_detection, cost=1.5)
+))
+
+if LOCAL_DETECTORS:
+    register_detector("ela", LocalBackend("Error Level Analysis", error_level_analysis))
+    register_detector("jpeg_history", LocalBackend("JPEG Compression History", jpeg_compression_history))
+    register_detector("noise_spectrum", LocalBackend("Noise Spectrum", noise_spectrum))
+
+def detector_stats():
+    """Per-backend call statistics and circuit state for this process"""
+    return {
+        key: dict(backend.stats.snapshot(), api_name=backend.api_name, circuit=backend.breaker.state)
+        for key, backend in DETECTORS.items()
+    }
+
+DEFAULT_POLICY = load_policy()
+
+REVERSE_SEARCH_TIMEOUT = float(os.environ.get("POWERHEX_REVERSE_SEARCH_TIMEOUT", "3"))
+
+def detector_error(api_name, message):
+    """Placeholder result for a detector that failed or timed out"""
+    return {
+        "is_fake": None,
+        "confidence": None,
+        "api_name": api_name,
+        "error": message,
+        "details": {}
+    }
+
+def detector_skipped(api_name, reason):
+    """Placeholder result for a detector that was not needed for the verdict"""
+    return {
+        "is_fake": None,
+        "confidence": None,
+        "api_name": api_name,
+        "skipped": reason,
+        "details": {}
+    }
+
+def run_concurrently(calls, stop_when=None, on_done=None):
+    """Run calls on the shared pool and gather what finishes within each deadline.
+
+    ``calls`` maps a name to ``(callable, args, timeout)``; they are submitted
+    in the given order. Returns ``(results, errors, abandoned)``: finished
+    results by name, an error message for every call that raised or missed
+    its deadline, and the names given up on because ``stop_when(results,
+    pending_names)`` returned true after some call finished. A slow call
+    never delays the others beyond its own timeout. ``on_done(name, result,
+    error)`` is called as each call finishes, fails or times out.
+    """
+    start = time.monotonic()
+    futures = {name: _executor.submit(fn, *args) for name, (fn, args, _) in calls.items()}
+    names = {future: name for name, future in futures.items()}
+    deadlines = {name: start + timeout for name, (_, _, timeout) in calls.items()}
+
+    results = {}
+    errors = {}
+    pending = dict(futures)
+    while pending:
+        now = time.monotonic()
+        for name in [n for n in pending if deadlines[n] <= now]:
+            pending.pop(name).cancel()
+            errors[name] = f"timed out after {calls[name][2]:g}s"
+            if on_done is not None:
+                on_done(name, None, errors[name])
+        if not pending:
+            break
+
+        next_deadline = min(deadlines[name] for name in pending)
+        done, _ = wait(pending.values(), timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            name = names[future]
+            del pending[name]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+            if on_done is not None:
+                on_done(name, results.get(name), errors.get(name))
+
+        if done and stop_when is not None and pending and stop_when(results, set(pending)):
+            # Queued calls are cancelled; running ones finish unobserved
+            for future in pending.values():
+                future.cancel()
+            return results, errors, set(pending)
+
+    return results, errors, set()
+
+def _timed_reverse_search(image_hash, timer):
+    with timer.stage("reverse_search") if timer else timed("reverse_search"):
+        return reverse_image_search(image_hash)
+
+def start_reverse_search(image_hash, timer=None):
+    """Start reverse search on the shared pool; returns a function that waits for its results.
+
+    The wait ends REVERSE_SEARCH_TIMEOUT seconds after the start, with no
+    results if the search has not finished by then.
+    """
+    future = _executor.submit(_timed_reverse_search, image_hash, timer)
+    deadline = time.monotonic() + REVERSE_SEARCH_TIMEOUT
+
+    def results():
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except Exception:
+            future.cancel()
+            return []
+
+    return results
+
+def run_detectors(payload, image_hash, policy=None, on_result=None):
+    """Run the registered detectors, cheapest first, plus reverse search.
+
+    Stops waiting (and skips later stages) as soon as the fusion policy says
+    the remaining detectors cannot change the verdict. Returns
+    ``(detector_results, reverse_results)``; reverse search is left out
+    when image_hash is None. ``on_result(key, result)`` is called with each
+    detector's final result as soon as it is known.
+    """
+    policy = policy or DEFAULT_POLICY
+    report = on_result or (lambda key, result: None)
+    detectors = sorted(DETECTORS.items(), key=lambda item: item[1].cost)
+    reverse_results = start_reverse_search(image_hash, payload.timer) if image_hash is not None else list
+
+    if policy.staged:
+        stages = [
+            [(key, backend) for key, backend in detectors if backend.cost <= policy.fast_cost],
+            [(key, backend) for key, backend in detectors if backend.cost > policy.fast_cost]
+        ]
+    else:
+        stages = [detectors]
+    stages = [stage for stage in stages if stage]
+
+    detector_results = {}
+    for index, stage in enumerate(stages):
+        later = {key for later_stage in stages[index + 1:] for key, _ in later_stage}
+        if policy.decide(detector_results, {key for key, _ in stage} | later) is not None:
+            for key, backend in stage:
+                detector_results[key] = detector_skipped(backend.api_name, "verdict already decided")
+                report(key, detector_results[key])
+            continue
+
+        # Each backend gets the deadline its result is waited for, so retries stop there too
+        now = time.monotonic()
+        calls = {key: (backend.run, (payload, now + backend.timeout), backend.timeout) for key, backend in stage}
+        names = dict(stage)
+        results, errors, abandoned = run_concurrently(
+            calls,
+            stop_when=lambda done, pending: policy.decide({**detector_results, **done}, pending | later) is not None,
+            on_done=lambda key, result, error: report(key, result or detector_error(names[key].api_name, error))
+        )
+        for key, backend in stage:
+            if key in results:
+                detector_results[key] = results[key]
+            elif key in abandoned:
+                detector_results[key] = detector_skipped(backend.api_name, "verdict already decided")
+                report(key, detector_results[key])
+            else:
+                detector_results[key] = detector_error(backend.api_name, errors.get(key, "no result"))
+
+    return detector_results, reverse_results()
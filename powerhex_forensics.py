@@ -0,0 +1,294 @@
+"""Local forensic analyzers: fast first-pass detectors computed in-process.
+
+Each analyzer takes a parsed upload (``powerhex_ingest.UploadedImage``),
+works on its grayscale pixels with NumPy and returns the same result
+schema as the remote detectors, so they plug into the detector registry
+(see ``LocalBackend`` in powerhex_detectors):
+
+- ``error_level_analysis``: re-saves the image as JPEG and looks for
+  regions whose recompression error, relative to their texture, stands
+  out from the rest, as areas pasted in after the last compression do.
+- ``jpeg_compression_history``: estimates the JPEG quality from the
+  quantization table and checks the DCT coefficient histograms for the
+  periodic gaps and peaks that a second compression leaves behind. Any
+  re-save does that to the whole image, so only double compression that
+  is confined to some regions counts as strong evidence.
+- ``noise_spectrum``: looks for isolated peaks in the spectrum of the
+  noise residual, the periodic trace of the upsampling layers in
+  generative models.
+
+All three are heuristics. Strong evidence pushes the confidence towards
+MAX_CONFIDENCE, but a clean result only lowers it to CLEAN_CONFIDENCE, and
+fusion leaves local results below its ``local_min_confidence`` out of the
+verdict (see powerhex_fusion.FusionPolicy): they can settle an obvious fake
+early, never clear an image.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+CLEAN_CONFIDENCE = 0.3
+MAX_CONFIDENCE = 0.95
+FAKE_THRESHOLD = 0.6
+
+ELA_QUALITY = 85
+ELA_TILE = 16
+# Error level analysis runs on the central crop of this size (pixels per side)
+ELA_MAX_SIDE = 1024
+
+# Low-frequency AC coefficients, (row, column) in zigzag order, used for the
+# double compression check; higher frequencies are mostly quantized to zero
+JPEG_FREQUENCIES = ((0, 1), (1, 0), (2, 0), (1, 1), (0, 2), (0, 3), (1, 2), (2, 1), (3, 0))
+JPEG_MAX_LEVEL = 20
+JPEG_MIN_SAMPLES = 200
+# At most about this many 8x8 blocks are transformed, in evenly spaced block rows
+JPEG_MAX_BLOCKS = 32768
+# Regions of this many (sampled) blocks per side are scored separately; a
+# region below JPEG_SINGLE_REGION looks singly compressed, above
+# JPEG_DOUBLE_REGION doubly. Evidence is localized when at least
+# JPEG_LOCAL_REGIONS regions are on each side.
+JPEG_REGION_BLOCKS = 16
+JPEG_REGION_MIN_SAMPLES = 50
+JPEG_SINGLE_REGION = 0.2
+JPEG_DOUBLE_REGION = 0.5
+JPEG_LOCAL_REGIONS = 2
+# Whole-image double compression (a benign re-save) stays below FAKE_THRESHOLD
+JPEG_GLOBAL_CONFIDENCE = 0.5
+
+SPECTRUM_SIZE = 512
+SPECTRUM_RINGS = 32
+
+# Standard JPEG (IJG) luminance quantization table, natural order
+IJG_LUMINANCE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+], dtype=np.float64).reshape(8, 8)
+
+def _dct_matrix(size=8):
+    """Orthonormal DCT-II matrix"""
+    k = np.arange(size)
+    matrix = np.cos(np.pi * np.outer(k, 2 * k + 1) / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT_MATRIX = _dct_matrix()
+# Basis images of JPEG_FREQUENCIES, flattened: coefficients = blocks @ _JPEG_BASIS.T
+_JPEG_BASIS = np.stack([np.outer(_DCT_MATRIX[u], _DCT_MATRIX[v]).ravel() for u, v in JPEG_FREQUENCIES]).astype(np.float32)
+
+def _confidence(value, low, high):
+    """Map a score linearly from [low, high] onto [CLEAN_CONFIDENCE, MAX_CONFIDENCE]"""
+    position = min(max((value - low) / (high - low), 0.0), 1.0)
+    return CLEAN_CONFIDENCE + position * (MAX_CONFIDENCE - CLEAN_CONFIDENCE)
+
+def _result(api_name, confidence, details):
+    return {
+        "is_fake": confidence > FAKE_THRESHOLD,
+        "confidence": confidence,
+        "api_name": api_name,
+        "details": details
+    }
+
+def _not_applicable(api_name, reason):
+    return {
+        "is_fake": None,
+        "confidence": None,
+        "api_name": api_name,
+        "skipped": reason,
+        "details": {}
+    }
+
+def _center_crop(pixels, side, align=8):
+    """The central side x side region, with its origin on the JPEG block grid"""
+    height, width = pixels.shape
+    top = (max(height - side, 0) // 2) // align * align
+    left = (max(width - side, 0) // 2) // align * align
+    return pixels[top:top + side, left:left + side]
+
+def _tiles(values, tile):
+    """Mean of each tile x tile block (partial edge tiles are dropped)"""
+    height, width = values.shape[0] // tile * tile, values.shape[1] // tile * tile
+    return values[:height, :width].reshape(height // tile, tile, width // tile, tile).mean(axis=(1, 3))
+
+def _residual(pixels):
+    """Difference from the mean of the four neighbours; removes the image content"""
+    return pixels[1:-1, 1:-1] - (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]) / 4
+
+def error_level_analysis(upload, api_name="Error Level Analysis"):
+    """Regions whose JPEG recompression error is far from the image's typical level"""
+    luma = np.asarray(upload.luma())
+    crop = _center_crop(luma, ELA_MAX_SIDE)
+    height, width = crop.shape[0] // ELA_TILE * ELA_TILE, crop.shape[1] // ELA_TILE * ELA_TILE
+    if height < 4 * ELA_TILE or width < 4 * ELA_TILE:
+        return _not_applicable(api_name, "image too small")
+    crop = crop[:height, :width]
+
+    buffer = io.BytesIO()
+    Image.fromarray(crop).save(buffer, format="JPEG", quality=ELA_QUALITY)
+    resaved = np.asarray(Image.open(buffer), dtype=np.int16)
+    error = _tiles(np.abs(crop.astype(np.int16) - resaved).astype(np.float32), ELA_TILE)
+    # Detailed areas always change more on recompression; compare error per unit of texture
+    texture = np.zeros(crop.shape, dtype=np.float32)
+    texture[1:-1, 1:-1] = np.abs(_residual(crop.astype(np.float32)))
+    ratio = error / (_tiles(texture, ELA_TILE) + 1.0)
+
+    # Robust z-score per tile; the floor keeps near-uniform images from dividing by ~0
+    median = float(np.median(ratio))
+    spread = max(float(np.median(np.abs(ratio - median))) * 1.4826, 0.02 + 0.1 * median)
+    z = (ratio - median) / spread
+    anomaly = float(np.percentile(z, 99))
+
+    return _result(api_name, _confidence(anomaly, 4.0, 8.0), {
+        "error_level": round(float(error.mean()), 3),
+        "anomaly_score": round(anomaly, 2),
+        "anomalous_area": f"{(z > 4).mean():.1%}",
+        "analyzed_region": f"{width} x {height}"
+    })
+
+def estimate_jpeg_quality(table):
+    """Quality (1-100) of the IJG scaling closest to an 8x8 luminance quantization table"""
+    scale = float(np.mean(np.asarray(table, dtype=np.float64) / IJG_LUMINANCE)) * 100
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return int(round(min(max(quality, 1), 100)))
+
+def _coefficient_levels(luma, table):
+    """|Quantized JPEG_FREQUENCIES coefficients| per block, shape (block rows, block columns, frequencies)"""
+    rows, columns = luma.shape[0] // 8, luma.shape[1] // 8
+    step = max(-(-rows * columns // JPEG_MAX_BLOCKS), 1)
+    blocks = luma[:rows * 8, :columns * 8].reshape(rows, 8, columns, 8)[::step]
+    grid = blocks.shape[0], columns
+    blocks = blocks.swapaxes(1, 2).reshape(-1, 64).astype(np.float32) - 128
+
+    steps = np.array([table[u, v] for u, v in JPEG_FREQUENCIES], dtype=np.float32)
+    levels = np.abs(np.rint(blocks @ _JPEG_BASIS.T / steps)).astype(np.int64)
+    return levels.reshape(*grid, len(JPEG_FREQUENCIES))
+
+def _histogram_rises(levels, min_samples):
+    """Share of the (blocks, frequencies) level histograms that rises away from zero, or None"""
+    rises = total = 0
+    for column in levels.T:
+        column = column[(column >= 1) & (column < JPEG_MAX_LEVEL)]
+        histogram = np.bincount(column, minlength=JPEG_MAX_LEVEL)[1:]
+        if histogram.sum() < min_samples:
+            continue
+        rises += int(np.maximum(np.diff(histogram), 0).sum())
+        total += int(histogram.sum())
+    return rises / total if total else None
+
+def double_compression_score(luma, table):
+    """Share of each low-frequency coefficient histogram that rises away from zero.
+
+    A single compression leaves histograms of |quantized coefficient| that
+    fall off monotonically; requantizing an already compressed image with a
+    different table leaves periodic gaps and peaks, so the histograms keep
+    rising again. Returns None when too few coefficients are non-zero.
+    """
+    levels = _coefficient_levels(luma, table)
+    return _histogram_rises(levels.reshape(-1, levels.shape[-1]), JPEG_MIN_SAMPLES)
+
+def double_compression_map(luma, table):
+    """double_compression_score of each JPEG_REGION_BLOCKS region (NaN where there is too little texture)"""
+    levels = _coefficient_levels(luma, table)
+    size = JPEG_REGION_BLOCKS
+    scores = np.full((levels.shape[0] // size, levels.shape[1] // size), np.nan)
+    for row in range(scores.shape[0]):
+        for column in range(scores.shape[1]):
+            region = levels[row * size:(row + 1) * size, column * size:(column + 1) * size]
+            score = _histogram_rises(region.reshape(-1, region.shape[-1]), JPEG_REGION_MIN_SAMPLES)
+            if score is not None:
+                scores[row, column] = score
+    return scores
+
+def jpeg_compression_history(upload, api_name="JPEG Compression History"):
+    """Estimated quality and signs of double compression, from the Y channel's DCT coefficients"""
+    header = upload.header
+    tables = getattr(header, "quantization", None)
+    if header.format != "JPEG" or not tables:
+        return _not_applicable(api_name, "not a JPEG")
+    table = np.asarray(tables[0], dtype=np.float64).reshape(8, 8)
+    quality = estimate_jpeg_quality(table)
+
+    luma = upload.luma()
+    if luma.size != header.size:
+        return _result(api_name, CLEAN_CONFIDENCE, {
+            "estimated_quality": quality,
+            "double_compression": "not checked (image too large for a full-resolution decode)"
+        })
+
+    luma = np.asarray(luma)
+    score = double_compression_score(luma, table)
+    if score is None:
+        return _result(api_name, CLEAN_CONFIDENCE, {
+            "estimated_quality": quality,
+            "double_compression": "not checked (too little texture)"
+        })
+
+    # A re-save double-compresses everything; a splice leaves regions that differ from the rest
+    regions = double_compression_map(luma, table)
+    single = int(np.sum(regions < JPEG_SINGLE_REGION))
+    double = int(np.sum(regions > JPEG_DOUBLE_REGION))
+    localized = min(single, double)
+    if localized >= JPEG_LOCAL_REGIONS:
+        confidence = _confidence(localized, JPEG_LOCAL_REGIONS - 1, JPEG_LOCAL_REGIONS + 1)
+    else:
+        confidence = min(_confidence(score, 0.05, 0.5), JPEG_GLOBAL_CONFIDENCE)
+
+    return _result(api_name, confidence, {
+        "estimated_quality": quality,
+        "double_compression_score": round(score, 3),
+        "double_compressed": score > 0.1,
+        "regions_single_double": f"{single} / {double}",
+        "localized": localized >= JPEG_LOCAL_REGIONS
+    })
+
+def spectral_peak(luma):
+    """log10 of the strongest isolated peak in the noise residual's power spectrum.
+
+    Each frequency is compared with the mean power of its ring (same
+    radius). The JPEG block grid spreads power along whole lines at
+    multiples of 1/8 cycle per pixel, so points on those lines are compared
+    with their line's median instead; upsampling periods (2, 4, 8 pixels)
+    still stand out there as isolated points.
+    """
+    # Two extra pixels so the residual is SPECTRUM_SIZE wide and the grid harmonics fall on bins
+    residual = _residual(_center_crop(luma, SPECTRUM_SIZE + 2).astype(np.float32))
+    rows, columns = residual.shape
+    power = np.abs(np.fft.rfft2(residual - residual.mean())) ** 2
+
+    fy = np.fft.fftfreq(rows)[:, None]
+    fx = np.fft.rfftfreq(columns)[None, :]
+    radius = np.hypot(fx, fy)
+    rings = np.minimum((radius * 2 * SPECTRUM_RINGS).astype(np.int64), SPECTRUM_RINGS)
+    counts = np.bincount(rings.ravel(), minlength=SPECTRUM_RINGS + 1)
+    ring_power = np.bincount(rings.ravel(), power.ravel(), SPECTRUM_RINGS + 1) / np.maximum(counts, 1)
+
+    reference = ring_power[rings]
+    for column in range(0, columns // 2 + 1, max(columns // 8, 1)):
+        reference[:, column] = np.maximum(reference[:, column], np.median(power[:, column]))
+    for row in range(0, rows, max(rows // 8, 1)):
+        reference[row, :] = np.maximum(reference[row, :], np.median(power[row, :]))
+
+    excess = power[radius > 0.1] / np.maximum(reference[radius > 0.1], 1e-12)
+    return float(np.log10(max(excess.max(), 1e-12)))
+
+def noise_spectrum(upload, api_name="Noise Spectrum"):
+    """Periodic upsampling traces in the noise residual.
+
+    Non-JPEG uploads are analyzed on the preview, so this only sees the
+    native pixels of images up to PREVIEW_SIZE.
+    """
+    luma = np.asarray(upload.luma())
+    if min(luma.shape) < 64:
+        return _not_applicable(api_name, "image too small")
+    peak = spectral_peak(luma)
+
+    return _result(api_name, _confidence(peak, 2.0, 3.0), {
+        "spectral_peak": round(peak, 2),
+        "periodic_artifacts": peak > 2.5
+    })
@@ -0,0 +1,261 @@
+"""Confidence fusion: turning individual detector scores into one verdict.
+
+A FusionPolicy holds per-detector weights and calibration, the verdict
+thresholds and the early-exit rules. It has no dependency on the detectors
+themselves, so policies can be evaluated offline against recorded detector
+outputs:
+
+    python powerhex_fusion.py [--policy policy.json] [--limit 5000]
+
+replays the stored scans through a policy and reports how often it agrees
+with waiting for every detector, and how much detector time it would save.
+"""
+import argparse
+import json
+import math
+import os
+
+# The local forensic analyzers are cheap heuristics: they count for a quarter
+# of a remote detector unless a policy sets their weights, and only as
+# evidence of a fake (see ``local_min_confidence``)
+LOCAL_DETECTOR_WEIGHTS = {"ela": 0.25, "jpeg_history": 0.25, "noise_spectrum": 0.25}
+
+class FusionPolicy:
+    """Weighted, calibrated fusion with early exit.
+
+    - ``weights``: detector key -> weight (``default_weight`` otherwise);
+      LOCAL_DETECTOR_WEIGHTS apply to keys the policy leaves out.
+    - ``local_detectors``: keys (default: those of LOCAL_DETECTOR_WEIGHTS)
+      that only count once their calibrated confidence reaches
+      ``local_min_confidence``. A clean local result is left out rather
+      than fused as a vote for genuine, so without evidence of a fake the
+      verdict is the remote detectors' alone.
+    - ``calibration``: detector key -> ``(a, b)``; a raw score ``c`` becomes
+      ``sigmoid(a * logit(c) + b)`` (Platt scaling). Identity when absent.
+    - ``fake_threshold`` / ``suspicious_threshold``: verdict boundaries on
+      the fused score.
+    - Early exit: the verdict is final as soon as the still-pending
+      detectors can no longer change it, whatever they return. It is also
+      final once every detector so far agrees with calibrated confidence of
+      ``early_exit_confidence`` or more (either way) and their weights add
+      up to at least ``early_exit_min_weight``. Local detectors alone end a
+      scan as fake only with strong evidence: every score so far at
+      ``early_exit_local_confidence`` or more and local weight of at least
+      ``early_exit_local_weight``. Set ``early_exit_confidence`` to None to
+      only use the exact rule.
+    - ``staged``: run detectors with ``cost <= fast_cost`` first and only
+      start the rest if those did not decide. Otherwise everything starts
+      at once, in cost order, and stragglers are abandoned on early exit.
+    """
+
+    def __init__(self, name="default", weights=None, calibration=None, default_weight=1.0,
+                 fake_threshold=0.8, suspicious_threshold=0.6, early_exit_confidence=0.9,
+                 early_exit_min_weight=1.5, local_detectors=None, local_min_confidence=0.6,
+                 early_exit_local_confidence=0.95, early_exit_local_weight=0.5, staged=False, fast_cost=0.5):
+        self.name = name
+        self.weights = {**LOCAL_DETECTOR_WEIGHTS, **(weights or {})}
+        self.local_detectors = set(LOCAL_DETECTOR_WEIGHTS if local_detectors is None else local_detectors)
+        self.local_min_confidence = local_min_confidence
+        self.early_exit_local_confidence = early_exit_local_confidence
+        self.early_exit_local_weight = early_exit_local_weight
+        self.calibration = {key: tuple(value) for key, value in (calibration or {}).items()}
+        self.default_weight = default_weight
+        self.fake_threshold = fake_threshold
+        self.suspicious_threshold = suspicious_threshold
+        self.early_exit_confidence = early_exit_confidence
+        self.early_exit_min_weight = early_exit_min_weight
+        self.staged = staged
+        self.fast_cost = fast_cost
+
+    @classmethod
+    def from_dict(cls, config):
+        config = dict(config)
+        # Policies saved before early exit was weighted counted detectors of weight 1
+        if "early_exit_min_detectors" in config:
+            config.setdefault("early_exit_min_weight", float(config.pop("early_exit_min_detectors")))
+        return cls(**config)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def weight(self, key):
+        return self.weights.get(key, self.default_weight)
+
+    def calibrate(self, key, confidence):
+        if key not in self.calibration:
+            return confidence
+        a, b = self.calibration[key]
+        c = min(max(confidence, 1e-6), 1 - 1e-6)
+        return 1 / (1 + math.exp(-(a * math.log(c / (1 - c)) + b)))
+
+    def _scores(self, results):
+        """Calibrated confidence of every detector that produced one, without clean local results"""
+        scores = {
+            key: self.calibrate(key, result["confidence"])
+            for key, result in results.items()
+            if result.get("confidence") is not None and self.weight(key) > 0
+        }
+        return {
+            key: score for key, score in scores.items()
+            if key not in self.local_detectors or score >= self.local_min_confidence
+        }
+
+    def fuse(self, results):
+        """Weighted mean of calibrated confidences, or None when no detector answered"""
+        scores = self._scores(results)
+        total_weight = sum(self.weight(key) for key in scores)
+        if not total_weight:
+            return None
+        return sum(self.weight(key) * score for key, score in scores.items()) / total_weight
+
+    def classify(self, confidence):
+        """Map a fused confidence score to an overall result type"""
+        if confidence is None:
+            return "INCONCLUSIVE"
+        elif confidence > self.fake_threshold:
+            return "LIKELY FAKE"
+        elif confidence > self.suspicious_threshold:
+            return "SUSPICIOUS"
+        else:
+            return "LIKELY GENUINE"
+
+    def decide(self, results, pending):
+        """The final verdict if it is already settled given the pending detector keys, else None"""
+        scores = self._scores(results)
+        if not scores:
+            return None
+        if not pending:
+            return self.classify(self.fuse(results))
+
+        known_weight = sum(self.weight(key) for key in scores)
+        known_sum = sum(self.weight(key) * score for key, score in scores.items())
+        pending_weight = sum(self.weight(key) for key in pending if key not in self.local_detectors)
+        pending_local = sum(self.weight(key) for key in pending if key in self.local_detectors)
+
+        # Bounds on the fused score over every possible pending outcome (a
+        # pending detector timing out keeps the score inside them too). A
+        # pending local detector either drops out or scores local_min_confidence
+        # or more, so the lowest score has all of them out or all at that minimum.
+        total_weight = known_weight + pending_weight + pending_local
+        low = self.classify(min(
+            known_sum / (known_weight + pending_weight),
+            (known_sum + self.local_min_confidence * pending_local) / total_weight
+        ))
+        high = self.classify((known_sum + pending_weight + pending_local) / total_weight)
+        if low == high:
+            return low
+
+        if self.early_exit_confidence is not None:
+            values = scores.values()
+            if known_weight >= self.early_exit_min_weight and (
+                    all(v >= self.early_exit_confidence for v in values) or
+                    all(v <= 1 - self.early_exit_confidence for v in values)):
+                return self.classify(known_sum / known_weight)
+            local_weight = sum(self.weight(key) for key in scores if key in self.local_detectors)
+            if local_weight >= self.early_exit_local_weight and \
+                    all(v >= self.early_exit_local_confidence for v in values):
+                return self.classify(known_sum / known_weight)
+
+        return None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "weights": self.weights,
+            "calibration": self.calibration,
+            "default_weight": self.default_weight,
+            "fake_threshold": self.fake_threshold,
+            "suspicious_threshold": self.suspicious_threshold,
+            "early_exit_confidence": self.early_exit_confidence,
+            "early_exit_min_weight": self.early_exit_min_weight,
+            "local_detectors": sorted(self.local_detectors),
+            "local_min_confidence": self.local_min_confidence,
+            "early_exit_local_confidence": self.early_exit_local_confidence,
+            "early_exit_local_weight": self.early_exit_local_weight,
+            "staged": self.staged,
+            "fast_cost": self.fast_cost
+        }
+
+def load_policy():
+    """The policy named by POWERHEX_FUSION_POLICY (a JSON file), or the default one"""
+    path = os.environ.get("POWERHEX_FUSION_POLICY")
+    return FusionPolicy.from_file(path) if path else FusionPolicy()
+
+def replay(policy, records, costs=None):
+    """Evaluate a policy offline against recorded detector outputs.
+
+    ``records`` are stored per-scan detector result dicts (key -> result).
+    Detectors are assumed to finish in order of their recorded
+    ``latency_ms`` (falling back to ``costs[key]`` seconds), all launched
+    together. Returns a summary comparing the early-exit verdict with the
+    verdict after waiting for every detector.
+    """
+    costs = costs or {}
+    count = agree = 0
+    full_latency = early_latency = 0.0
+    calls = calls_used = 0
+
+    for record in records:
+        results = {key: value for key, value in record.items() if key != "reverse_search"}
+        if not results:
+            continue
+
+        def finish_time(key):
+            latency = results[key].get("latency_ms")
+            return latency / 1000 if latency is not None else costs.get(key, 1.0)
+
+        order = sorted(results, key=finish_time)
+        full_verdict = policy.classify(policy.fuse(results))
+
+        seen = {}
+        verdict = None
+        for index, key in enumerate(order):
+            seen[key] = results[key]
+            verdict = policy.decide(seen, order[index + 1:])
+            if verdict is not None:
+                break
+        if verdict is None:
+            verdict = full_verdict
+
+        count += 1
+        agree += verdict == full_verdict
+        full_latency += max(finish_time(key) for key in order)
+        early_latency += finish_time(order[len(seen) - 1])
+        calls += len(order)
+        calls_used += len(seen)
+
+    if not count:
+        return {"scans": 0}
+
+    return {
+        "policy": policy.name,
+        "scans": count,
+        "agreement": agree / count,
+        "avg_latency_full_s": full_latency / count,
+        "avg_latency_early_exit_s": early_latency / count,
+        "detector_calls_saved": 1 - calls_used / calls
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored scans through a fusion policy")
+    parser.add_argument("--policy", help="policy JSON file (default: built-in policy)")
+    parser.add_argument("--records", help="NDJSON file of detector results (default: the scans table)")
+    parser.add_argument("--limit", type=int, default=5000, help="most recent scans to replay from the database")
+    args = parser.parse_args(argv)
+
+    policy = FusionPolicy.from_file(args.policy) if args.policy else FusionPolicy()
+
+    if args.records:
+        with open(args.records) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        from powerhex_db import init_database, recorded_detector_results
+        init_database()
+        records = recorded_detector_results(args.limit)
+
+    print(json.dumps(replay(policy, records), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Memory-bounded image ingest.
+
+An upload is only ever held as its original bytes. The header (size,
+format, EXIF) is read without decoding any pixels; previews and analysis
+copies are decoded at reduced size with ``Image.draft`` (JPEG DCT scaling)
+and ``thumbnail``. A full-resolution decode only happens when a detector
+asks for a re-encoded copy (see ``ImagePayload.png``), or for the luma
+copy of a JPEG that the local forensic checks read (Y channel only).
+
+Images above MAX_IMAGE_PIXELS are rejected from the header, before
+anything is decoded.
+"""
+import io
+import os
+import threading
+
+from PIL import Image
+
+MAX_IMAGE_PIXELS = int(os.environ.get("POWERHEX_MAX_IMAGE_PIXELS", "80000000"))
+PREVIEW_SIZE = int(os.environ.get("POWERHEX_PREVIEW_SIZE", "1024"))
+# Long side of the copy hashed and analyzed locally; pHash only needs 32x32
+ANALYSIS_SIZE = 512
+# JPEGs up to this size get a full-resolution luma copy for the forensic checks
+FULL_DECODE_PIXELS = int(os.environ.get("POWERHEX_FULL_DECODE_PIXELS", "24000000"))
+
+# Pillow's own guard, for any decode that bypasses open_image()
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+class ImageTooLargeError(ValueError):
+    """Raised for uploads whose header declares more than MAX_IMAGE_PIXELS pixels"""
+
+class UploadedImage:
+    """An upload as bytes plus its lazily parsed header"""
+
+    def __init__(self, data):
+        self.data = data
+        self._preview = None
+        self._luma = None
+        self._lock = threading.RLock()
+        self.header = Image.open(io.BytesIO(data))
+        width, height = self.header.size
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ImageTooLargeError(
+                f"{width} x {height} image exceeds the {MAX_IMAGE_PIXELS / 1e6:.0f} megapixel limit"
+            )
+
+    @property
+    def size(self):
+        return self.header.size
+
+    def reduced(self, max_side):
+        """A fresh copy decoded at no more than max_side pixels on its long side"""
+        image = Image.open(io.BytesIO(self.data))
+        image.draft(None, (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        return image
+
+    def preview(self):
+        """Downscaled copy for display, decoded once"""
+        with self._lock:
+            if self._preview is None:
+                self._preview = self.reduced(PREVIEW_SIZE)
+            return self._preview
+
+    def luma(self):
+        """Grayscale copy for the forensic checks, decoded once.
+
+        JPEGs up to FULL_DECODE_PIXELS are decoded at full resolution, which
+        keeps their 8x8 block grid; only the Y channel is decoded. Anything
+        else is the grayscale preview.
+        """
+        with self._lock:
+            if self._luma is None:
+                width, height = self.size
+                if self.header.format == "JPEG" and width * height <= FULL_DECODE_PIXELS:
+                    image = Image.open(io.BytesIO(self.data))
+                    image.draft("L", image.size)
+                    self._luma = image.convert("L")
+                else:
+                    self._luma = self.preview().convert("L")
+            return self._luma
+
+    def analysis_copy(self):
+        """Downscaled copy for perceptual hashing and local checks, made from the preview"""
+        image = self.preview().copy()
+        image.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+        return image
+
+def open_image(data):
+    """Parse an upload's header, enforcing the size limit; nothing is decoded yet"""
+    return UploadedImage(data)
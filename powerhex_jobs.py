@@ -0,0 +1,161 @@
+"""Background scan jobs.
+
+Uploads are queued in the ``scan_jobs`` table and picked up by worker
+processes, so the Streamlit script thread only enqueues and polls. Because
+the queue lives in the database it survives app restarts; a running job
+whose worker stops heartbeating (every HEARTBEAT_SECONDS) for
+STALE_JOB_SECONDS is put back in the queue when a worker starts. Progress
+updates and the final result only apply while the job is still claimed
+by the same worker, so a requeued job is never saved twice.
+
+Run a standalone worker pool next to the app with:
+
+    python powerhex_jobs.py --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from powerhex_db import (
+    init_database, enqueue_job, claim_next_job, update_job_progress, heartbeat_job, finish_job,
+    get_jobs, requeue_stale_jobs, job_queue_depth
+)
+
+POLL_INTERVAL = float(os.environ.get("POWERHEX_JOB_POLL_INTERVAL", "0.5"))
+STALE_JOB_SECONDS = float(os.environ.get("POWERHEX_JOB_STALE_SECONDS", "120"))
+# Seconds between heartbeats of a running job, well under STALE_JOB_SECONDS
+HEARTBEAT_SECONDS = float(os.environ.get("POWERHEX_JOB_HEARTBEAT_SECONDS", str(STALE_JOB_SECONDS / 4)))
+# Worker processes the Streamlit app starts for itself; 0 relies on external workers
+LOCAL_WORKERS = int(os.environ.get("POWERHEX_LOCAL_WORKERS", "2"))
+
+class JobLost(Exception):
+    """The job was requeued while this worker ran it; its outcome must not be saved"""
+
+def submit_scan(image_bytes, filename, force_rescan=False):
+    """Queue a scan and return its job id"""
+    return enqueue_job(filename, image_bytes, force_rescan)
+
+def job_status(job_ids):
+    """Status rows keyed by job id, with finished results decoded"""
+    jobs = get_jobs(job_ids)
+    for job in jobs.values():
+        if job["result"]:
+            job["result"] = json.loads(job["result"])
+    return jobs
+
+@contextmanager
+def heartbeat(job_id, worker, interval=HEARTBEAT_SECONDS):
+    """Keep the job's updated_at fresh from a background thread while the block runs.
+
+    Liveness then does not depend on progress updates, which a scan slowed
+    down by detector retries may not send for minutes. Stops beating once
+    the job turns out to have been requeued.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            if not heartbeat_job(job_id, worker):
+                return
+
+    thread = threading.Thread(target=beat, name=f"powerhex-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def process_job(job_id, worker, filename, image_bytes, force_rescan):
+    # Imported here so the app process does not need the pipeline to enqueue
+    from powerhex_pipeline import analyze_image, save_scans
+    from powerhex_video import VIDEO_MAX_FRAMES
+
+    def progress(value, stage):
+        if not update_job_progress(job_id, worker, value, stage):
+            raise JobLost(job_id)
+
+    progress(0.1, "analyzing")
+    frames_done = []
+
+    def on_frame(frame):
+        # Clips only; VIDEO_MAX_FRAMES is an upper bound on the frames analyzed
+        frames_done.append(frame)
+        progress(0.1 + 0.8 * min(len(frames_done) / VIDEO_MAX_FRAMES, 1),
+                 f"analyzed frame {len(frames_done)} ({frame['time_s']} s)")
+
+    with heartbeat(job_id, worker):
+        results = analyze_image(bytes(image_bytes), filename, force_rescan=bool(force_rescan), on_frame=on_frame)
+
+        if not results["cached"]:
+            # Checked right before saving, so a requeued job is not stored twice
+            progress(0.9, "saving")
+            save_scans([results])
+
+    finish_job(job_id, worker, result=json.dumps(results, default=str))
+
+def worker_loop(worker_id, stop_event=None):
+    """Claim and process jobs until stop_event is set"""
+    init_database()
+    requeue_stale_jobs(STALE_JOB_SECONDS)
+
+    while stop_event is None or not stop_event.is_set():
+        job = claim_next_job(worker_id)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        job_id, filename, image_bytes, force_rescan = job
+        try:
+            process_job(job_id, worker_id, filename, image_bytes, force_rescan)
+        except JobLost:
+            pass
+        except Exception as e:
+            finish_job(job_id, worker_id, error=str(e))
+
+def worker_main(index):
+    worker_loop(f"{socket.gethostname()}:{os.getpid()}:{index}")
+
+def start_workers(count, daemon=True):
+    """Start worker processes and return them"""
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        process = context.Process(target=worker_main, args=(index,), name=f"powerhex-worker-{index}", daemon=daemon)
+        process.start()
+        processes.append(process)
+    return processes
+
+_local_workers = []
+_local_workers_lock = threading.Lock()
+
+def ensure_local_workers(count=LOCAL_WORKERS):
+    """Start (or restart) this process's own worker pool; a no-op when count is 0"""
+    with _local_workers_lock:
+        alive = [process for process in _local_workers if process.is_alive()]
+        if len(alive) < count:
+            alive += start_workers(count - len(alive))
+        _local_workers[:] = alive
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run PowerHEX background scan workers")
+    parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() or 1), help="worker processes")
+    args = parser.parse_args(argv)
+
+    init_database()
+    processes = start_workers(args.workers, daemon=False)
+    print(f"Started {len(processes)} PowerHEX workers; queue: {job_queue_depth()}")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
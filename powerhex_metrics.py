@@ -0,0 +1,154 @@
+"""Stage timing and latency histograms.
+
+Each scan is timed stage by stage with a ScanTimer; every stage duration
+and detector call is also observed into a process-wide histogram, keyed by
+metric name and labels. Histograms use fixed buckets, so they render as
+Prometheus text and give p50/p95/p99 estimates the same way Prometheus'
+``histogram_quantile`` does.
+
+The histograms only cover the current process. Per-scan timings are also
+stored with each scan, which is what the Operations page reads.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds in seconds, from sub-millisecond hashing to slow remote detectors
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 30.0
+)
+
+STAGE_METRIC = "powerhex_stage_seconds"
+DETECTOR_METRIC = "powerhex_detector_seconds"
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimated q-quantile, interpolated linearly inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for count, upper in zip(self.counts, self.buckets + (float("inf"),)):
+            if seen + count >= rank and count:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+class MetricsRegistry:
+    """Histograms by (metric name, sorted label pairs)"""
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def summary(self, name, label):
+        """{label value: {count, mean_ms, p50_ms, p95_ms, p99_ms}} for one metric"""
+        rows = {}
+        with self._lock:
+            for (metric, labels), histogram in self.histograms.items():
+                if metric != name:
+                    continue
+                rows[dict(labels).get(label, "")] = {
+                    "count": histogram.count,
+                    "mean_ms": histogram.sum / histogram.count * 1000,
+                    "p50_ms": histogram.quantile(0.5) * 1000,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                    "p99_ms": histogram.quantile(0.99) * 1000
+                }
+        return rows
+
+    def prometheus_text(self):
+        """All histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self.histograms})
+            for name in names:
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                    prefix = label_text + "," if label_text else ""
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                    suffix = f"{{{label_text}}}" if label_text else ""
+                    lines.append(f"{name}_sum{suffix} {histogram.sum}")
+                    lines.append(f"{name}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+class ScanTimer:
+    """Wall-clock milliseconds per stage of one scan.
+
+    Stages may be recorded from detector pool threads, including ones that
+    are abandoned and only finish after the scan has returned; finish()
+    hands out a copy so those late stages do not change a saved result.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.timings[name] = round(self.timings.get(name, 0) + seconds * 1000, 2)
+        metrics.observe(STAGE_METRIC, seconds, stage=name)
+
+    def finish(self, name="total"):
+        """Record the total under `name` and return a copy of the timings"""
+        self.record(name, time.perf_counter() - self._start)
+        with self._lock:
+            return dict(self.timings)
+
+@contextmanager
+def timed(name):
+    """Time a stage outside any one scan (e.g. a batch insert)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(STAGE_METRIC, time.perf_counter() - start, stage=name)
@@ -0,0 +1,304 @@
+"""PostgreSQL storage backend for powerhex_db.
+
+Selected by pointing POWERHEX_DATABASE_URL at a postgresql:// database;
+without it PowerHEX keeps using the SQLite file at POWERHEX_DB. Several app
+instances, API servers and job workers can then share one database behind
+a load balancer. Needs psycopg 3 and its pool:
+
+    pip install "psycopg[binary,pool]"
+
+powerhex_db's statements use SQLite's ``?`` placeholders. PostgresConnection
+translates them, and timestamps load as text like SQLite returns them, so
+most statements run unchanged; the few that differ have PostgreSQL variants
+in powerhex_db, and create_schema mirrors init_database's schema.
+"""
+from contextlib import contextmanager
+
+from psycopg.types.string import TextLoader
+from psycopg_pool import ConnectionPool as PsycopgPool
+
+# Confidence bin of a scan, as CONFIDENCE_BIN_SQL in powerhex_db
+# (PostgreSQL's integer cast rounds, so floor explicitly)
+CONFIDENCE_BIN_SQL = (
+    "CASE WHEN {c} IS NULL THEN -1 "
+    "ELSE LEAST(GREATEST(FLOOR({c} * {bins})::integer, 0), {bins} - 1) END"
+)
+
+# Rows per multi-row INSERT, well under PostgreSQL's 65535 parameters per statement
+INSERT_CHUNK_ROWS = 2000
+
+class PostgresConnection:
+    """A pooled psycopg connection with the sqlite3 methods powerhex_db uses.
+
+    ``?`` placeholders are rewritten to ``%s`` only when parameters are
+    passed, so parameterless statements (DDL, function bodies) go through
+    untouched.
+    """
+    dialect = "postgresql"
+    # Appended to SELECTs that claim rows; concurrent claimers skip each other's rows
+    for_update = " FOR UPDATE SKIP LOCKED"
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    def _sql(sql):
+        return sql.replace("%", "%%").replace("?", "%s")
+
+    def execute(self, sql, params=()):
+        if not params:
+            return self.conn.execute(sql)
+        return self.conn.execute(self._sql(sql), list(params))
+
+    @staticmethod
+    def _multi_row(sql, count):
+        """An INSERT ... VALUES (...) statement rewritten to insert `count` rows at once"""
+        head, values = sql.rsplit("VALUES", 1)
+        values = values.strip()
+        row, tail = values[:values.index(")") + 1], values[values.index(")") + 1:]
+        return f"{head} VALUES {', '.join([row] * count)} {tail}"
+
+    def _insert_chunks(self, sql, rows):
+        for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+            chunk = [tuple(row) for row in rows[start:start + INSERT_CHUNK_ROWS]]
+            yield self.conn.execute(self._sql(self._multi_row(sql, len(chunk))), [value for row in chunk for value in row])
+
+    def executemany(self, sql, rows):
+        """Run sql for every row; INSERTs become multi-row statements of up to INSERT_CHUNK_ROWS rows"""
+        rows = list(rows)
+        if rows and sql.lstrip().upper().startswith("INSERT"):
+            for _ in self._insert_chunks(sql, rows):
+                pass
+        elif rows:
+            self.conn.cursor().executemany(self._sql(sql), rows)
+
+    def insert_many(self, sql, rows):
+        """Insert rows with multi-row INSERT ... RETURNING id statements; returns the ids in order.
+
+        One statement per chunk also means the version trigger locks its
+        row once per chunk, so concurrent bulk inserts cannot deadlock on it.
+        """
+        rows = list(rows)
+        return [row[0] for cursor in self._insert_chunks(sql + " RETURNING id", rows) for row in cursor.fetchall()]
+
+    def begin_write(self):
+        """No-op: PostgreSQL locks the claimed rows (see for_update) instead of the whole database"""
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+class PostgresPool:
+    """Thread-safe pool of PostgreSQL connections, with the interface of powerhex_db.ConnectionPool"""
+    dialect = "postgresql"
+
+    def __init__(self, url, size, busy_timeout_ms):
+        self.path = url
+        self.size = size
+        self._pool = PsycopgPool(
+            url,
+            min_size=1,
+            max_size=size,
+            timeout=busy_timeout_ms / 1000,
+            configure=self._configure,
+            open=True
+        )
+
+    @staticmethod
+    def _configure(conn):
+        # Timestamps come back as 'YYYY-MM-DD HH:MM:SS[.ffffff]' text, as from SQLite
+        conn.adapters.register_loader("timestamp", TextLoader)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success and rolls back on error"""
+        with self._pool.connection() as conn:
+            yield PostgresConnection(conn)
+
+    def close(self):
+        self._pool.close()
+
+def _create_trigger(conn, name, definition):
+    if conn.execute("SELECT 1 FROM pg_trigger WHERE tgname = ?", (name,)).fetchone() is None:
+        conn.execute(definition)
+
+def create_schema(conn, confidence_bins, seed_snapshots_sql):
+    """Create the PowerHEX tables, indexes and triggers if missing"""
+    # Instances starting together take turns
+    conn.execute("SELECT pg_advisory_xact_lock(hashtext('powerhex_schema'))")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scans (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            filename TEXT,
+            file_hash TEXT,
+            scan_result TEXT,
+            confidence_score DOUBLE PRECISION,
+            timestamp TIMESTAMP,
+            metadata TEXT,
+            flagged BOOLEAN NOT NULL DEFAULT FALSE,
+            flag_reason TEXT,
+            detector_results TEXT,
+            timings TEXT,
+            compacted BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS educational_stats (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            quiz_taken BOOLEAN,
+            score INTEGER,
+            timestamp TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_file_hash ON scans (file_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_timestamp ON scans (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_scan_result ON scans (scan_result)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_flagged ON scans (flagged)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_uncompacted ON scans (timestamp) WHERE compacted = FALSE")
+
+    # Dashboard snapshots and their change log (see SNAPSHOT_TABLES in powerhex_db)
+    snapshots_exist = conn.execute("SELECT to_regclass('dashboard_results')").fetchone()[0] is not None
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_changes (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            day TEXT NOT NULL,
+            scan_result TEXT NOT NULL,
+            confidence_bin INTEGER NOT NULL,
+            confidence DOUBLE PRECISION,
+            scans INTEGER NOT NULL,
+            flagged INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_results (
+            scan_result TEXT PRIMARY KEY,
+            scans INTEGER NOT NULL,
+            flagged INTEGER NOT NULL,
+            confidence_sum DOUBLE PRECISION NOT NULL,
+            confidence_count INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_confidence_bins (
+            confidence_bin INTEGER PRIMARY KEY,
+            scans INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_daily (
+            day TEXT PRIMARY KEY,
+            scans INTEGER NOT NULL
+        )
+    ''')
+    change = (
+        "COALESCE({s}.timestamp::date, CURRENT_DATE)::text, COALESCE({s}.scan_result, ''), "
+        + CONFIDENCE_BIN_SQL.format(c="{s}.confidence_score", bins=confidence_bins)
+    )
+    # Inserts are logged per statement, from its transition table; appending
+    # takes no lock on shared rows, unlike updating counters in place
+    conn.execute(f'''
+        CREATE OR REPLACE FUNCTION powerhex_scans_log_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO scan_changes (day, scan_result, confidence_bin, confidence, scans, flagged)
+            SELECT {change.format(s="inserted")}, inserted.confidence_score, 1, CASE WHEN inserted.flagged THEN 1 ELSE 0 END
+            FROM inserted;
+            RETURN NULL;
+        END $$
+    ''')
+    _create_trigger(conn, "trg_scans_changes_insert", '''
+        CREATE TRIGGER trg_scans_changes_insert AFTER INSERT ON scans
+        REFERENCING NEW TABLE AS inserted
+        FOR EACH STATEMENT EXECUTE FUNCTION powerhex_scans_log_insert()
+    ''')
+    # Transition tables cannot be limited to UPDATE OF flagged, so flag changes are logged per row
+    conn.execute(f'''
+        CREATE OR REPLACE FUNCTION powerhex_scans_log_flag() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO scan_changes (day, scan_result, confidence_bin, confidence, scans, flagged)
+            VALUES ({change.format(s="OLD")}, NULL, 0, CASE WHEN NEW.flagged THEN 1 ELSE -1 END);
+            RETURN NULL;
+        END $$
+    ''')
+    _create_trigger(conn, "trg_scans_changes_flag", '''
+        CREATE TRIGGER trg_scans_changes_flag AFTER UPDATE OF flagged ON scans
+        FOR EACH ROW WHEN (OLD.flagged IS DISTINCT FROM NEW.flagged)
+        EXECUTE FUNCTION powerhex_scans_log_flag()
+    ''')
+    if not snapshots_exist:
+        # Seeded from the daily rollup the snapshots replace, which still counts archived scans
+        if conn.execute("SELECT to_regclass('scan_rollup_daily')").fetchone()[0] is not None:
+            source = "scan_rollup_daily"
+        else:
+            source = f'''(
+                SELECT COALESCE(timestamp::date, CURRENT_DATE)::text AS day, COALESCE(scan_result, '') AS scan_result,
+                       {CONFIDENCE_BIN_SQL.format(c="confidence_score", bins=confidence_bins)} AS confidence_bin,
+                       COUNT(*) AS scans, COALESCE(SUM(confidence_score), 0) AS confidence_sum
+                FROM scans
+                GROUP BY 1, 2, 3
+            )'''
+        for sql in seed_snapshots_sql:
+            conn.execute(sql.format(source=source))
+        conn.execute("DROP TRIGGER IF EXISTS trg_scans_rollup_daily ON scans")
+        conn.execute("DROP FUNCTION IF EXISTS powerhex_scans_rollup()")
+        conn.execute("DROP TABLE IF EXISTS scan_rollup_daily")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_phashes (
+            scan_id BIGINT PRIMARY KEY REFERENCES scans (id),
+            phash BIGINT NOT NULL
+        )
+    ''')
+
+    # Values are stored as text; value_num holds those that read as numbers,
+    # for the numeric metadata filters
+    conn.execute(r'''
+        CREATE TABLE IF NOT EXISTS scan_metadata (
+            scan_id BIGINT NOT NULL REFERENCES scans (id),
+            key TEXT NOT NULL,
+            value TEXT,
+            value_num DOUBLE PRECISION GENERATED ALWAYS AS (
+                CASE WHEN value ~ '^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]{1,3})?\s*$'
+                     AND length(value) < 300 THEN value::double precision END
+            ) STORED,
+            PRIMARY KEY (scan_id, key)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_metadata_key_value ON scan_metadata (key, value)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_metadata_key_value_num ON scan_metadata (key, value_num)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            filename TEXT,
+            image BYTEA,
+            force_rescan BOOLEAN DEFAULT FALSE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+            stage TEXT,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            created_at TIMESTAMP,
+            started_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs (status, id)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO data_versions (name, version) VALUES ('dashboard', 0) ON CONFLICT DO NOTHING")
+    # The 'scans' version is a sequence, bumped after each write commits (see
+    # scans_write); the trigger that updated a shared row instead held its
+    # lock until commit, serializing scan inserts across instances
+    conn.execute("CREATE SEQUENCE IF NOT EXISTS powerhex_scans_version")
+    conn.execute("DROP TRIGGER IF EXISTS trg_scans_version ON scans")
+    conn.execute("DROP FUNCTION IF EXISTS powerhex_scans_version()")
@@ -0,0 +1,153 @@
+"""Perceptual hashes and a near-duplicate index over past scans.
+
+pHash/dHash are 64-bit fingerprints that survive resizing and
+recompression. Every scan's pHash is stored in ``scan_phashes``; an
+in-process multi-index hash mirrors that table and answers Hamming-radius
+queries by probing a few buckets instead of comparing every entry.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from powerhex_db import load_phashes_since
+
+SEARCH_RADIUS = int(os.environ.get("POWERHEX_PHASH_RADIUS", "8"))
+# Seconds after which a scan id seen in the index is assumed not to be
+# overtaken by a lower id committing late (concurrent writers on PostgreSQL)
+REFRESH_GRACE = float(os.environ.get("POWERHEX_PHASH_REFRESH_GRACE", "60"))
+
+_DCT_SIZE = 32
+_DCT_MATRIX = np.cos(
+    np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE)
+)
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+def phash(image):
+    """64-bit DCT perceptual hash: signs of the low frequencies against their median"""
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:8, :8].ravel()
+    # The DC term only encodes overall brightness
+    return _bits_to_int(low > np.median(low[1:]))
+
+def dhash(image):
+    """64-bit difference hash: is each pixel brighter than its right neighbour"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def to_signed(value):
+    """Store an unsigned 64-bit hash in an SQLite INTEGER"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def _flip_masks(bits, max_distance):
+    """Every mask of `bits` bits with at most max_distance bits set"""
+    masks = [0]
+    for _ in range(max_distance):
+        masks = sorted(set(masks) | {mask | (1 << bit) for mask in masks for bit in range(bits)})
+    return masks
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit codes with Hamming distance.
+
+    Each code is split into CHUNKS substrings, each indexed in its own hash
+    table. If two codes are within distance r, at least one substring pair
+    is within r // CHUNKS (pigeonhole), so a query only probes the buckets
+    near its own substrings and verifies those candidates exactly.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self.tables = [{} for _ in range(self.CHUNKS)]
+        self.codes = {}
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, item):
+        return item in self.codes
+
+    def _chunks(self, code):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(code >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, code, item):
+        self.codes[item] = code
+        for table, chunk in zip(self.tables, self._chunks(code)):
+            table.setdefault(chunk, []).append(item)
+
+    def search(self, code, radius):
+        """(item, distance) pairs within radius of code"""
+        sub_radius = radius // self.CHUNKS
+        if sub_radius not in self._masks:
+            self._masks[sub_radius] = _flip_masks(self.CHUNK_BITS, sub_radius)
+
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(code)):
+            for mask in self._masks[sub_radius]:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        matches = []
+        for item in candidates:
+            distance = hamming(code, self.codes[item])
+            if distance <= radius:
+                matches.append((item, distance))
+        return matches
+
+class PerceptualIndex:
+    """Multi-index hash of stored scan pHashes, topped up from the database before each query.
+
+    Scan ids are not committed in order when several instances write to
+    PostgreSQL, so a lower id can appear after a higher one was indexed.
+    Each refresh therefore re-reads every id above ``settled_id``, which
+    only moves up to the highest id seen ``grace`` seconds ago.
+    """
+
+    def __init__(self, grace=REFRESH_GRACE):
+        self.index = MultiIndexHash()
+        self.grace = grace
+        # Every stored pHash up to this scan id is indexed
+        self.settled_id = 0
+        # (time, highest scan id indexed by then), oldest first
+        self._seen = deque()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        now = time.monotonic()
+        highest = self._seen[-1][1] if self._seen else self.settled_id
+        for scan_id, value in load_phashes_since(self.settled_id):
+            if scan_id not in self.index:
+                self.index.add(to_unsigned(value), scan_id)
+            highest = max(highest, scan_id)
+        if not self._seen or highest > self._seen[-1][1]:
+            self._seen.append((now, highest))
+        while self._seen and now - self._seen[0][0] >= self.grace:
+            self.settled_id = max(self.settled_id, self._seen.popleft()[1])
+
+    def search(self, value, radius=SEARCH_RADIUS):
+        """(scan_id, distance) of stored scans within radius, closest first"""
+        with self._lock:
+            self.refresh()
+            matches = self.index.search(value, radius)
+        return sorted(matches, key=lambda match: (match[1], -match[0]))
+
+# Process-wide index, shared across sessions
+phash_index = PerceptualIndex()
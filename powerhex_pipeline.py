@@ -0,0 +1,320 @@
+"""Headless scan pipeline shared by the Streamlit app and the CLI tools.
+
+Nothing in here calls ``st.*``; callers decide how to present progress.
+"""
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+
+from PIL.ExifTags import IFD, TAGS
+from PIL.TiffImagePlugin import IFDRational
+
+from powerhex_cache import content_hash, result_cache
+from powerhex_db import METADATA_MAX_VALUE_LENGTH, find_latest_scan, insert_scans, get_scans, get_scan_metadata
+from powerhex_detectors import DEFAULT_POLICY, ImagePayload, run_detectors, start_reverse_search
+from powerhex_metrics import ScanTimer, timed
+from powerhex_phash import phash, phash_index, to_signed
+from powerhex_video import FRAME_BATCH, Clip, aggregate_frames, open_media, sample_frames
+
+# Overall verdict styling: result type -> (css class, icon)
+RESULT_STYLES = {
+    "LIKELY FAKE": ("fake-result", "🚨"),
+    "SUSPICIOUS": ("suspicious-result", "⚠️"),
+    "LIKELY GENUINE": ("genuine-result", "✅"),
+    "INCONCLUSIVE": ("suspicious-result", "❔"),
+}
+
+# Image metadata extraction
+def metadata_value(data):
+    """A tag value reduced to something small that SQLite and JSON can store.
+
+    Numbers stay numbers; text is capped at METADATA_MAX_VALUE_LENGTH;
+    binary blobs (MakerNote, UserComment, ...) are kept as readable text
+    when they are, and otherwise replaced by their size and a short hash.
+    """
+    if isinstance(data, bytes):
+        try:
+            text = data.decode("utf-8").strip("\x00 ")
+        except UnicodeDecodeError:
+            text = None
+        if text is None or not text.isprintable():
+            return f"<{len(data)} bytes, blake2b {content_hash(data)[:16]}>"
+        data = text
+    elif isinstance(data, IFDRational):
+        return float(data) if data.denominator else None
+    elif isinstance(data, (bool, int, float)):
+        return data
+    elif isinstance(data, tuple):
+        data = ", ".join(str(metadata_value(item)) for item in data)
+    return str(data)[:METADATA_MAX_VALUE_LENGTH]
+
+def extract_metadata(image):
+    """Extract EXIF metadata from image (an unloaded header is enough)"""
+    try:
+        exifdata = image.getexif()
+        metadata = {}
+
+        if exifdata:
+            # Camera, lens and capture tags live in the Exif sub-IFD
+            tags = dict(exifdata)
+            tags.update(exifdata.get_ifd(IFD.Exif))
+            for tag_id, data in tags.items():
+                if tag_id in (IFD.Exif, IFD.GPSInfo):
+                    continue
+                tag = TAGS.get(tag_id, tag_id)
+                metadata[str(tag)] = metadata_value(data)
+
+        # Add basic image info
+        metadata.update({
+            "Image Size": f"{image.size[0]} x {image.size[1]}",
+            "Image Mode": image.mode,
+            "Image Format": image.format
+        })
+
+        return metadata
+    except Exception as e:
+        return {"Error": f"Could not extract metadata: {str(e)}"}
+
+def load_cached_scan(file_hash, max_age):
+    """Load the latest stored scan for a content hash, if it is recent enough"""
+    row = find_latest_scan(file_hash, datetime.now() - timedelta(seconds=max_age))
+    if row is None:
+        return None
+
+    scan_id, result_type, confidence, timestamp, metadata, detector_results = row
+    detector_results = json.loads(detector_results)
+    reverse_results = detector_results.pop("reverse_search", [])
+    result_class, result_icon = RESULT_STYLES.get(result_type, RESULT_STYLES["INCONCLUSIVE"])
+    scanned_at = datetime.fromisoformat(str(timestamp))
+
+    return scanned_at.timestamp(), {
+        "result_type": result_type,
+        "result_class": result_class,
+        "result_icon": result_icon,
+        "confidence": confidence,
+        "deepware": detector_results.get("deepware"),
+        "faceforensics": detector_results.get("faceforensics"),
+        "detectors": detector_results,
+        # Scans stored before scan_metadata existed only have the JSON blob
+        "metadata": json.loads(metadata) if metadata else get_scan_metadata(scan_id),
+        "reverse_search": reverse_results,
+        "file_hash": file_hash,
+        "timestamp": scanned_at
+    }
+
+result_cache.loader = load_cached_scan
+
+# Frames of every clip being scanned in this process are analyzed here, FRAME_BATCH at a time
+_frame_executor = ThreadPoolExecutor(max_workers=FRAME_BATCH, thread_name_prefix="powerhex-frame")
+
+def find_similar_scans(image_phash, limit=10):
+    """Earlier local scans of the same visual content, as a reverse search result"""
+    matches = phash_index.search(image_phash)[:limit]
+    scans = get_scans([scan_id for scan_id, _ in matches])
+
+    similar = []
+    for scan_id, distance in matches:
+        if scan_id in scans:
+            _, filename, scan_result, confidence, timestamp = scans[scan_id]
+            similar.append({
+                "scan_id": scan_id,
+                "filename": filename,
+                "scan_result": scan_result,
+                "confidence": confidence,
+                "timestamp": str(timestamp),
+                "distance": distance
+            })
+
+    return {
+        "source": "PowerHEX scan history",
+        "matches": len(similar),
+        "earliest_date": min((s["timestamp"][:10] for s in similar), default="n/a"),
+        "similar_scans": similar
+    }
+
+def analyze_frame(frame, policy):
+    """Detector results for one sampled clip frame, handed to the detectors as a PNG"""
+    buffer = io.BytesIO()
+    frame.image.save(buffer, format="PNG")
+    detector_results, _ = run_detectors(ImagePayload(buffer.getvalue(), image=frame.image), None, policy)
+    return detector_results
+
+def analyze_clip(clip, file_hash, filename, timer, policy, on_detector=None, on_frame=None):
+    """Detection for a video or animated image: sampled frames in batches, aggregated into one verdict.
+
+    Frames are pulled from the sampler FRAME_BATCH at a time and dropped once
+    analyzed; only their scores are kept. ``on_frame(frame)`` is called with
+    each frame's entry of the returned ``frames`` timeline.
+    """
+    reverse_results = start_reverse_search(file_hash, timer)
+    with timer.stage("metadata"):
+        metadata = clip.metadata()
+
+    stats = {}
+    frames = sample_frames(clip, stats=stats)
+    frame_results = []
+    timeline = []
+    clip_phash = None
+    while True:
+        with timer.stage("frames"):
+            batch = list(islice(frames, FRAME_BATCH))
+        if not batch:
+            break
+        with timer.stage("detectors"):
+            batch_results = list(_frame_executor.map(lambda frame: analyze_frame(frame, policy), batch))
+        for frame, detector_results in zip(batch, batch_results):
+            clip_phash = frame.phash if clip_phash is None else clip_phash
+            confidence = policy.fuse(detector_results)
+            entry = {
+                "index": frame.index,
+                "time_s": round(frame.time, 2),
+                "confidence": confidence,
+                "result_type": policy.classify(confidence)
+            }
+            frame_results.append(detector_results)
+            timeline.append(entry)
+            if on_frame is not None:
+                on_frame(entry)
+
+    metadata.update({
+        "Frames Decoded": stats["decoded"],
+        "Frames Sampled": stats["sampled"],
+        "Frames Analyzed": len(timeline),
+        "Duplicate Frames": stats["duplicates"],
+        "Sample Interval": stats["interval"]
+    })
+    if clip.decode_error:
+        metadata["Decode Error"] = clip.decode_error
+
+    local_matches = None
+    if clip_phash is not None:
+        with timer.stage("similar_search"):
+            local_matches = find_similar_scans(clip_phash)
+
+    with timer.stage("fusion"):
+        detector_results = aggregate_frames(frame_results)
+        avg_confidence = policy.fuse(detector_results)
+        result_type = policy.classify(avg_confidence)
+    result_class, result_icon = RESULT_STYLES[result_type]
+    if on_detector is not None:
+        for key, result in detector_results.items():
+            on_detector(key, result)
+
+    return {
+        "result_type": result_type,
+        "result_class": result_class,
+        "result_icon": result_icon,
+        "confidence": avg_confidence,
+        "deepware": detector_results.get("deepware"),
+        "faceforensics": detector_results.get("faceforensics"),
+        "detectors": detector_results,
+        "metadata": metadata,
+        "reverse_search": ([local_matches] if local_matches else []) + reverse_results(),
+        "file_hash": file_hash,
+        "phash": f"{clip_phash:016x}" if clip_phash is not None else None,
+        "fusion_policy": policy.name,
+        "frames": timeline,
+        "filename": filename,
+        "timestamp": datetime.now(),
+        "timings": timer.finish(),
+        "cached": False
+    }
+
+def analyze_image(image_bytes, filename, force_rescan=False, policy=None, on_detector=None, on_frame=None):
+    """Run hashing, cache lookup, metadata extraction and detection for one upload.
+
+    Nothing is written to the database; pass fresh results to save_scans().
+    The returned dict has ``cached=True`` when an earlier verdict was reused.
+    ``on_detector(key, result)`` is called as each detector finishes.
+    Videos and animated images go through analyze_clip, which calls
+    ``on_frame(frame)`` as each sampled frame is scored.
+    Raises ImageTooLargeError for uploads over the pixel limit.
+    """
+    policy = policy or DEFAULT_POLICY
+    timer = ScanTimer()
+    with timer.stage("hash"):
+        file_hash = content_hash(image_bytes)
+
+    # Reuse an earlier verdict for the same content
+    if not force_rescan:
+        with timer.stage("cache_lookup"):
+            cached = result_cache.get(file_hash)
+        if cached is not None:
+            return dict(cached, filename=filename, cached=True, timings=timer.finish("total_cached"))
+
+    with timer.stage("metadata"):
+        upload = open_media(image_bytes)
+    if isinstance(upload, Clip):
+        return analyze_clip(upload, file_hash, filename, timer, policy, on_detector, on_frame)
+
+    with timer.stage("metadata"):
+        metadata = extract_metadata(upload.header)
+    with timer.stage("phash"):
+        image_phash = phash(upload.analysis_copy())
+    with timer.stage("similar_search"):
+        local_matches = find_similar_scans(image_phash)
+    with timer.stage("detectors"):
+        detector_results, reverse_results = run_detectors(
+            ImagePayload(image_bytes, timer=timer, upload=upload), file_hash, policy, on_result=on_detector
+        )
+    reverse_results = [local_matches] + reverse_results
+
+    with timer.stage("fusion"):
+        # Combine results from the detectors that answered in time
+        avg_confidence = policy.fuse(detector_results)
+
+        # Determine overall result
+        result_type = policy.classify(avg_confidence)
+    result_class, result_icon = RESULT_STYLES[result_type]
+
+    return {
+        "result_type": result_type,
+        "result_class": result_class,
+        "result_icon": result_icon,
+        "confidence": avg_confidence,
+        "deepware": detector_results.get("deepware"),
+        "faceforensics": detector_results.get("faceforensics"),
+        "detectors": detector_results,
+        "metadata": metadata,
+        "reverse_search": reverse_results,
+        "file_hash": file_hash,
+        "phash": f"{image_phash:016x}",
+        "fusion_policy": policy.name,
+        "filename": filename,
+        "timestamp": datetime.now(),
+        "timings": timer.finish(),
+        "cached": False
+    }
+
+def is_cacheable(results):
+    """Whether a verdict may be reused: no detector failed or timed out"""
+    return not any(isinstance(result, dict) and result.get("error") for result in results["detectors"].values())
+
+def save_scans(results_list):
+    """Store freshly analyzed results in one transaction and publish the complete ones to the cache"""
+    rows = [
+        (results["filename"], results["file_hash"], results["result_type"], results["confidence"],
+         results["timestamp"], None,
+         json.dumps({**results["detectors"], "reverse_search": results["reverse_search"]}))
+        for results in results_list
+    ]
+    if not rows:
+        return
+
+    phashes = [to_signed(int(results["phash"], 16)) if results.get("phash") else None for results in results_list]
+    timings = [results.get("timings") for results in results_list]
+    # Timed for the histograms only; the rows are written before it is known
+    with timed("db_insert"):
+        insert_scans(rows, phashes, [results["metadata"] for results in results_list], timings)
+    for results in results_list:
+        if is_cacheable(results):
+            result_cache.put(results["file_hash"], results, results["timestamp"].timestamp())
+
+def scan_image(image_bytes, filename, force_rescan=False):
+    """Analyze one upload and store the result unless it came from the cache"""
+    results = analyze_image(image_bytes, filename, force_rescan=force_rescan)
+    if not results["cached"]:
+        save_scans([results])
+    return results
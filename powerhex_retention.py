@@ -0,0 +1,226 @@
+"""Data retention, archival and compaction.
+
+Three policies keep powerhex_data.db small as scans accumulate (days, 0
+turns a policy off). The two that drop scan data are off until configured:
+
+- RETENTION_FULL_DAYS: scans keep their full detail (EXIF tags, metadata
+  JSON, detector details, reverse search results, stage timings) this
+  long, then are compacted to summary rows.
+- RETENTION_ARCHIVE_DAYS: scans (except open reports) and quiz results
+  older than this are moved out of the database into monthly gzip NDJSON
+  partitions in ARCHIVE_DIR, e.g. ``scans-2025-10.ndjson.gz``.
+- RETENTION_JOB_DAYS: finished background jobs are deleted after this.
+
+Archived scans stay in the dashboard totals and trends, which come from
+the dashboard snapshots (see powerhex_rollup); ``scan_history`` (the scan
+history export) reads the database and the archive together. Nothing else
+reads the archive: recent scans, the reviewed-scans list, metadata search,
+detector health, stage timings and near-duplicate matching only see scans
+still in the database. Pages freed by compaction and
+archiving are returned to the filesystem by incremental vacuum, a few at
+a time.
+
+The app runs the policies every RETENTION_INTERVAL seconds in a background
+thread. To run them by hand, or to convert a database created before
+incremental vacuum existed (rewrites the file once):
+
+    python powerhex_retention.py [--enable-incremental-vacuum]
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from powerhex_db import (
+    DB_PATH, init_database, compact_scans, archive_candidates, delete_archived, delete_finished_jobs, scans_between,
+    storage_stats, incremental_vacuum, enable_incremental_vacuum
+)
+
+# Scan compaction and archiving are opt-in: they drop detail or move rows out of the database
+RETENTION_FULL_DAYS = int(os.environ.get("POWERHEX_RETENTION_FULL_DAYS", "0"))
+RETENTION_ARCHIVE_DAYS = int(os.environ.get("POWERHEX_RETENTION_ARCHIVE_DAYS", "0"))
+RETENTION_JOB_DAYS = int(os.environ.get("POWERHEX_RETENTION_JOB_DAYS", "7"))
+# Seconds between background runs in the app; 0 disables the background thread
+RETENTION_INTERVAL = float(os.environ.get("POWERHEX_RETENTION_INTERVAL", "3600"))
+ARCHIVE_DIR = os.environ.get("POWERHEX_ARCHIVE_DIR", os.path.splitext(DB_PATH)[0] + "_archive")
+# Rows per compaction or archive transaction; each holds the write lock briefly
+RETENTION_BATCH = int(os.environ.get("POWERHEX_RETENTION_BATCH", "2000"))
+# Pages returned to the filesystem per incremental vacuum step, and the pause between steps
+VACUUM_PAGES = int(os.environ.get("POWERHEX_VACUUM_PAGES", "1000"))
+VACUUM_PAUSE = 0.05
+# Seconds one vacuum() call may spend; the next retention run continues from there
+VACUUM_MAX_SECONDS = float(os.environ.get("POWERHEX_VACUUM_MAX_SECONDS", "30"))
+
+# Columns stored as JSON text, decoded in the archive
+JSON_COLUMNS = ("metadata", "detector_results", "timings")
+
+def partition_path(table, month):
+    return os.path.join(ARCHIVE_DIR, f"{table}-{month}.ndjson.gz")
+
+def _decode(record):
+    for column in JSON_COLUMNS:
+        value = record.get(column)
+        if isinstance(value, str):
+            try:
+                record[column] = json.loads(value)
+            except ValueError:
+                pass
+    return record
+
+def write_partitions(table, records):
+    """Append records to their monthly partitions; each call adds one gzip member per file"""
+    months = {}
+    for record in records:
+        months.setdefault(str(record["timestamp"])[:7], []).append(_decode(record))
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, rows in months.items():
+        with open(partition_path(table, month), "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="ab", compresslevel=6) as archive:
+                archive.write("".join(json.dumps(row, default=str) + "\n" for row in rows).encode())
+            f.flush()
+            os.fsync(f.fileno())
+
+def archive(table, before, batch=RETENTION_BATCH):
+    """Move every archivable row of `table` older than `before` to the archive; returns how many.
+
+    Rows are deleted only after their partition is written and synced, and
+    the database write lock is only taken for the delete. A crash in
+    between, or two overlapping runs, leave rows in both places or in the
+    archive twice; readers skip the copies.
+    """
+    archived = 0
+    while True:
+        records = archive_candidates(table, before, batch)
+        if not records:
+            return archived
+        write_partitions(table, records)
+        archived += delete_archived(table, [record["id"] for record in records])
+
+def partitions(table, date_from=None, date_to=None):
+    """Archive files of one table whose month overlaps [date_from, date_to], oldest first"""
+    prefix = os.path.join(ARCHIVE_DIR, f"{table}-")
+    first = date_from.strftime("%Y-%m") if date_from else ""
+    last = date_to.strftime("%Y-%m") if date_to else "9999-99"
+    return [
+        path for path in sorted(glob.glob(prefix + "*.ndjson.gz"))
+        if first <= path[len(prefix):-len(".ndjson.gz")] <= last
+    ]
+
+def iter_archive(table, date_from=None, date_to=None):
+    """Archived rows of one table between two dates (inclusive), each row once"""
+    start = date_from.isoformat() if date_from else ""
+    end = (date_to + timedelta(days=1)).isoformat() if date_to else "9999"
+    seen = set()
+    for path in partitions(table, date_from, date_to):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if start <= str(record["timestamp"]) < end and record["id"] not in seen:
+                    seen.add(record["id"])
+                    yield record
+
+def scan_history(date_from=None, date_to=None):
+    """Summary rows of every scan between two dates, archived or not, oldest first"""
+    recent = scans_between(date_from, date_to)
+    archived = pd.DataFrame(
+        [[record.get(column) for column in recent.columns] for record in iter_archive("scans", date_from, date_to)],
+        columns=recent.columns
+    )
+    if archived.empty:
+        return recent
+    if recent.empty:
+        return archived
+    history = pd.concat([archived, recent], ignore_index=True)
+    return history.drop_duplicates("id", keep="last").sort_values("timestamp", ignore_index=True)
+
+def archive_stats():
+    """Number and total size of the archive partitions"""
+    paths = glob.glob(os.path.join(ARCHIVE_DIR, "*.ndjson.gz"))
+    return {"partitions": len(paths), "size_bytes": sum(os.path.getsize(path) for path in paths)}
+
+def vacuum(pages=VACUUM_PAGES, max_seconds=VACUUM_MAX_SECONDS):
+    """Return free pages to the filesystem in small steps, pausing so writers get the lock in between.
+
+    Stops after max_seconds, as writers may keep freeing pages, and returns
+    the free pages left; without incremental vacuum that is all of them.
+    """
+    stats = storage_stats()
+    if not stats["incremental_vacuum"]:
+        return stats["free_pages"]
+    deadline = time.monotonic() + max_seconds
+    remaining = incremental_vacuum(pages)
+    while remaining and time.monotonic() + VACUUM_PAUSE < deadline:
+        time.sleep(VACUUM_PAUSE)
+        remaining = incremental_vacuum(pages)
+    return remaining
+
+def run_retention(now=None):
+    """Apply the retention policies once; returns what was done"""
+    now = now or datetime.now()
+    stats = {"archived_scans": 0, "archived_quiz_results": 0, "compacted_scans": 0, "deleted_jobs": 0}
+
+    # Archive first, so rows about to leave are not compacted on the way out
+    if RETENTION_ARCHIVE_DAYS > 0:
+        before = now - timedelta(days=RETENTION_ARCHIVE_DAYS)
+        stats["archived_scans"] = archive("scans", before)
+        stats["archived_quiz_results"] = archive("educational_stats", before)
+    if RETENTION_FULL_DAYS > 0:
+        before = now - timedelta(days=RETENTION_FULL_DAYS)
+        while True:
+            count = compact_scans(before, RETENTION_BATCH)
+            stats["compacted_scans"] += count
+            if count < RETENTION_BATCH:
+                break
+    if RETENTION_JOB_DAYS > 0:
+        stats["deleted_jobs"] = delete_finished_jobs(now - timedelta(days=RETENTION_JOB_DAYS))
+
+    stats["free_pages"] = vacuum()
+    return stats
+
+# Outcome of this process's latest background run, for the Operations page
+last_run = {}
+_thread = None
+_thread_lock = threading.Lock()
+
+def retention_loop(interval=RETENTION_INTERVAL, stop_event=None):
+    """Run the policies every `interval` seconds until stop_event is set"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        started = datetime.now()
+        try:
+            last_run.update(started_at=started, stats=run_retention(started), error=None)
+        except Exception as e:
+            last_run.update(started_at=started, error=str(e))
+        stop_event.wait(interval)
+
+def ensure_retention_thread(interval=RETENTION_INTERVAL):
+    """Start this process's background retention thread once; a no-op when interval is 0"""
+    global _thread
+    if interval <= 0:
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=retention_loop, args=(interval,), name="powerhex-retention", daemon=True)
+            _thread.start()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the PowerHEX retention policies once")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert the database to incremental vacuum first (rewrites the whole file)")
+    args = parser.parse_args(argv)
+
+    init_database()
+    if args.enable_incremental_vacuum and not storage_stats()["incremental_vacuum"]:
+        enable_incremental_vacuum()
+    print(json.dumps(run_retention(), indent=2))
+    print(json.dumps({"database": storage_stats(), "archive": {"path": ARCHIVE_DIR, **archive_stats()}}, indent=2))
+
+if __name__ == "__main__":
+    main()
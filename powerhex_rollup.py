@@ -0,0 +1,82 @@
+"""Rollup worker for the dashboard snapshots.
+
+The Analytics Dashboard reads only small snapshot tables: scans, open
+reports and confidence sums per result, scans per confidence bin and
+scans per day (see SNAPSHOT_TABLES in powerhex_db). Triggers on scans
+append every insert and flag change to the scan_changes log; this worker
+folds the log into the snapshots, ROLLUP_BATCH changes per transaction,
+and deletes what it applied. Saving, flagging and resolving scans only
+append to the log and never update the snapshot counters themselves; the
+one shared counter they touch is the 'scans' data version, bumped once
+per write after it commits (a sequence on PostgreSQL, so no row lock).
+The dashboard reads the same few rows with ten scans or tens of millions.
+
+The app and the API server run the worker every ROLLUP_INTERVAL seconds in
+a background thread, so the dashboard trails new scans and reports by about
+that long. Workers in several processes can run at once; each claims its
+own changes. To catch up by hand, or next to job workers with no app:
+
+    python powerhex_rollup.py [--watch]
+"""
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+
+from powerhex_db import apply_scan_changes, init_database, pending_scan_changes
+
+# Seconds between background runs; 0 disables the background thread
+ROLLUP_INTERVAL = float(os.environ.get("POWERHEX_ROLLUP_INTERVAL", "1"))
+# Changes per transaction; each holds the write lock briefly
+ROLLUP_BATCH = int(os.environ.get("POWERHEX_ROLLUP_BATCH", "5000"))
+
+def run_rollup(batch=ROLLUP_BATCH):
+    """Apply every pending change to the snapshots; returns how many were applied"""
+    applied = 0
+    while True:
+        count = apply_scan_changes(batch)
+        applied += count
+        if count < batch:
+            return applied
+
+# Outcome of this process's latest background run, for the Operations page
+last_run = {}
+_thread = None
+_thread_lock = threading.Lock()
+
+def rollup_loop(interval=ROLLUP_INTERVAL, stop_event=None):
+    """Apply pending changes every `interval` seconds until stop_event is set"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        started = datetime.now()
+        try:
+            last_run.update(started_at=started, applied=run_rollup(), error=None)
+        except Exception as e:
+            last_run.update(started_at=started, error=str(e))
+        stop_event.wait(interval)
+
+def ensure_rollup_thread(interval=ROLLUP_INTERVAL):
+    """Start this process's background rollup thread once; a no-op when interval is 0"""
+    global _thread
+    if interval <= 0:
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=rollup_loop, args=(interval,), name="powerhex-rollup", daemon=True)
+            _thread.start()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply pending changes to the PowerHEX dashboard snapshots")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"keep applying them every {ROLLUP_INTERVAL:g} seconds (POWERHEX_ROLLUP_INTERVAL)")
+    args = parser.parse_args(argv)
+
+    init_database()
+    if args.watch:
+        rollup_loop(ROLLUP_INTERVAL or 1)
+    else:
+        print(json.dumps({"applied": run_rollup(), "pending": pending_scan_changes()}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""Video and animated image ingest: lazy decoding and frame sampling.
+
+A clip (MP4/MOV, WebM/MKV or AVI video, or an animated GIF, WebP or PNG)
+is held as its original bytes, like an image upload. Frames are decoded
+one at a time as the sampler pulls them and scaled to FRAME_SIZE straight
+away, so memory stays bounded however long the clip is:
+
+- Sampling: up to VIDEO_MAX_FRAMES frames spread evenly over the clip, at
+  least VIDEO_MIN_INTERVAL seconds apart (animations, whose duration is
+  only known after decoding every frame, are spread by frame count). Once
+  that spacing reaches KEYFRAME_INTERVAL only keyframes are decoded; the
+  rest of a long video is demuxed but never decoded.
+- Dedupe: a sampled frame within FRAME_DEDUPE_DISTANCE bits (pHash) of one
+  already kept is dropped, so static shots and looping animations are not
+  analyzed twice.
+- Aggregation: each detector's per-frame scores become one clip score, the
+  mean of its highest TOP_FRAME_FRACTION of frames, so a manipulated
+  stretch of an otherwise genuine clip still shows.
+
+Video decoding needs PyAV (``pip install av``); animated images only need
+Pillow.
+"""
+import io
+import math
+import os
+import threading
+from collections import namedtuple
+
+from PIL import Image, UnidentifiedImageError
+
+from powerhex_db import METADATA_MAX_VALUE_LENGTH
+from powerhex_ingest import MAX_IMAGE_PIXELS, PREVIEW_SIZE, ImageTooLargeError, open_image
+from powerhex_phash import hamming, phash
+
+VIDEO_MAX_FRAMES = int(os.environ.get("POWERHEX_VIDEO_MAX_FRAMES", "16"))
+VIDEO_MIN_INTERVAL = float(os.environ.get("POWERHEX_VIDEO_MIN_INTERVAL", "0.5"))
+# Sample spacing (seconds) from which only keyframes are decoded
+KEYFRAME_INTERVAL = float(os.environ.get("POWERHEX_KEYFRAME_INTERVAL", "2"))
+FRAME_DEDUPE_DISTANCE = int(os.environ.get("POWERHEX_FRAME_DEDUPE_DISTANCE", "6"))
+# Frames analyzed concurrently, which is also the most decoded frames held at once
+FRAME_BATCH = int(os.environ.get("POWERHEX_FRAME_BATCH", "4"))
+# Long side of the frames handed to the detectors
+FRAME_SIZE = PREVIEW_SIZE
+TOP_FRAME_FRACTION = 0.25
+# Browsers show GIF frames with a shorter delay than this for 100 ms
+MIN_FRAME_DELAY_MS = 20
+
+VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.webm', '.mkv', '.avi')
+ANIMATION_EXTENSIONS = ('.gif', '.webp')
+
+# ISO base media brands that are still images (HEIF, AVIF), not video
+_IMAGE_BRANDS = (b"heic", b"heix", b"hevc", b"mif1", b"msf1", b"avif", b"avis")
+
+# A decoded frame kept by the sampler: position in the clip, scaled RGB image and pHash
+Frame = namedtuple("Frame", "index time image phash")
+
+def is_video(data):
+    """Whether the bytes start like a video container (MP4/MOV, Matroska/WebM, AVI)"""
+    head = bytes(data[:12])
+    if head[4:8] == b"ftyp":
+        return head[8:12] not in _IMAGE_BRANDS
+    return head[:4] == b"\x1aE\xdf\xa3" or (head[:4] == b"RIFF" and head[8:12] == b"AVI ")
+
+def _scaled_size(size, max_side):
+    width, height = size
+    scale = min(max_side / max(width, height), 1.0)
+    # Even dimensions keep the chroma planes aligned when scaling video frames
+    return max(int(width * scale) // 2 * 2, 2), max(int(height * scale) // 2 * 2, 2)
+
+def _import_av():
+    try:
+        import av
+    except ImportError:
+        raise UnidentifiedImageError("video scanning needs PyAV (pip install av)") from None
+    return av
+
+class Clip:
+    """A video or animated image as bytes plus its container header; frames are decoded on demand"""
+
+    def __init__(self, data, header=None):
+        self.data = data
+        self._preview = None
+        self._lock = threading.Lock()
+        # Set when decoding stopped early on corrupt data
+        self.decode_error = None
+        if header is None:
+            self._probe_video()
+        else:
+            self._probe_animation(header)
+
+        width, height = self.size
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ImageTooLargeError(
+                f"{width} x {height} frames exceed the {MAX_IMAGE_PIXELS / 1e6:.0f} megapixel limit"
+            )
+
+    def _open_container(self):
+        av = _import_av()
+        try:
+            return av.open(io.BytesIO(self.data))
+        except av.FFmpegError as e:
+            raise UnidentifiedImageError(f"cannot read video: {e}") from None
+
+    def _probe_video(self):
+        with self._open_container() as container:
+            if not container.streams.video:
+                raise UnidentifiedImageError("no video stream")
+            stream = container.streams.video[0]
+            self.kind = "video"
+            self.format = container.format.long_name
+            self.codec = stream.codec_context.name
+            self.size = (stream.codec_context.width, stream.codec_context.height)
+            if stream.duration:
+                self.duration = float(stream.duration * stream.time_base)
+            elif container.duration:
+                self.duration = container.duration / 1_000_000
+            else:
+                self.duration = None
+            self.frame_rate = float(stream.average_rate) if stream.average_rate else None
+            self.frame_count = stream.frames or None
+            self.tags = {**container.metadata, **stream.metadata}
+
+    def _probe_animation(self, header):
+        self.kind = "animation"
+        self.format = header.format
+        self.codec = None
+        self.size = header.size
+        self.frame_count = header.n_frames
+        # Frame delays are only known frame by frame, as each is decoded
+        self.duration = None
+        self.frame_rate = None
+        self.tags = {}
+
+    @staticmethod
+    def _delay(image):
+        delay = image.info.get("duration") or 0
+        return delay if delay >= MIN_FRAME_DELAY_MS else 100
+
+    def sample_spacing(self, max_frames=VIDEO_MAX_FRAMES):
+        """(spacing, unit) of sampled frames: the clip spread over max_frames, in seconds when its duration is known"""
+        if self.duration:
+            return max(self.duration / max_frames, VIDEO_MIN_INTERVAL), "s"
+        if self.frame_count:
+            return max(self.frame_count / max_frames, 1), "frames"
+        return VIDEO_MIN_INTERVAL, "s"
+
+    def frames(self, keyframes_only=False, max_side=FRAME_SIZE):
+        """Yield (index, seconds, load) for each decoded frame, in order.
+
+        ``load()`` converts the frame to an RGB image of at most max_side
+        pixels; it is only valid until the next frame is pulled, and frames
+        the caller skips are never converted.
+        """
+        if self.kind == "video":
+            yield from self._video_frames(keyframes_only, max_side)
+        else:
+            yield from self._animation_frames(max_side)
+
+    def _video_frames(self, keyframes_only, max_side):
+        av = _import_av()
+        width, height = _scaled_size(self.size, max_side)
+        rate = self.frame_rate or 25
+        decoded = 0
+        with self._open_container() as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            if keyframes_only:
+                stream.codec_context.skip_frame = "NONKEY"
+            try:
+                for frame in container.decode(stream):
+                    # Frame number in the clip, also when only keyframes are decoded
+                    seconds = float(frame.time) if frame.time is not None else decoded / rate
+                    decoded += 1
+                    yield round(seconds * rate), seconds, lambda frame=frame: frame.to_image(width=width, height=height)
+            except av.FFmpegError as e:
+                if not decoded:
+                    raise UnidentifiedImageError(f"cannot decode video: {e}") from None
+                self.decode_error = str(e)
+
+    def _animation_frames(self, max_side):
+        image = Image.open(io.BytesIO(self.data))
+        seconds = 0.0
+        for index in range(self.frame_count):
+            image.seek(index)
+            yield index, seconds, lambda: self._scaled(image, max_side)
+            seconds += self._delay(image) / 1000
+
+    @staticmethod
+    def _scaled(image, max_side):
+        frame = image.convert("RGB")
+        frame.thumbnail((max_side, max_side))
+        return frame
+
+    def preview(self):
+        """The first frame, downscaled for display, decoded once"""
+        with self._lock:
+            if self._preview is None:
+                frames = self.frames(keyframes_only=True, max_side=PREVIEW_SIZE)
+                try:
+                    _, _, load = next(frames, (None, None, None))
+                    if load is None:
+                        raise UnidentifiedImageError("clip has no frames")
+                    self._preview = load()
+                finally:
+                    frames.close()
+            return self._preview
+
+    def metadata(self):
+        """Container tags plus size, duration and frame rate, in the shape of extract_metadata's result"""
+        metadata = {str(key): str(value)[:METADATA_MAX_VALUE_LENGTH] for key, value in self.tags.items()}
+        metadata.update({
+            "Image Size": f"{self.size[0]} x {self.size[1]}",
+            "Image Format": self.format,
+            "Media Type": "video" if self.kind == "video" else "animated image",
+            "Codec": self.codec,
+            "Duration (s)": round(self.duration, 2) if self.duration else None,
+            "Frame Rate": round(self.frame_rate, 2) if self.frame_rate else None,
+            "Frame Count": self.frame_count
+        })
+        return {key: value for key, value in metadata.items() if value is not None}
+
+def open_media(data):
+    """Parse an upload's header: a Clip for videos and animated images, otherwise an UploadedImage.
+
+    Raises ImageTooLargeError over the pixel limit and UnidentifiedImageError
+    for anything that is neither.
+    """
+    if is_video(data):
+        return Clip(data)
+    upload = open_image(data)
+    if getattr(upload.header, "is_animated", False):
+        return Clip(data, upload.header)
+    return upload
+
+def sample_frames(clip, max_frames=VIDEO_MAX_FRAMES, stats=None):
+    """Yield up to max_frames distinct Frames spread over the clip, decoding lazily.
+
+    ``stats`` (a dict) is filled with the sampling interval and the number
+    of frames decoded, sampled and dropped as duplicates.
+    """
+    spacing, unit = clip.sample_spacing(max_frames)
+    keyframes_only = clip.kind == "video" and unit == "s" and spacing >= KEYFRAME_INTERVAL
+    stats = stats if stats is not None else {}
+    stats.update(interval=f"{spacing:.3g} {unit}", keyframes_only=keyframes_only, decoded=0, sampled=0, duplicates=0)
+
+    kept = []
+    next_due = 0.0
+    for index, seconds, load in clip.frames(keyframes_only):
+        stats["decoded"] += 1
+        position = seconds if unit == "s" else index
+        if position < next_due:
+            continue
+        next_due = position + spacing
+        stats["sampled"] += 1
+
+        image = load()
+        code = phash(image)
+        if any(hamming(code, other) <= FRAME_DEDUPE_DISTANCE for other in kept):
+            stats["duplicates"] += 1
+            continue
+        kept.append(code)
+        yield Frame(index, seconds, image, code)
+        if len(kept) >= max_frames:
+            return
+
+def aggregate_detector(results):
+    """One clip-level result from a detector's per-frame results"""
+    scored = [result for result in results if result.get("confidence") is not None]
+    if not scored:
+        # Every frame failed or was skipped; report a failure if there was one
+        return dict(next((result for result in results if result.get("error")), results[0]))
+
+    scores = sorted((result["confidence"] for result in scored), reverse=True)
+    top = scores[:max(1, math.ceil(len(scores) * TOP_FRAME_FRACTION))]
+    fake_frames = sum(bool(result["is_fake"]) for result in scored)
+    latencies = [result["latency_ms"] for result in scored if result.get("latency_ms") is not None]
+
+    aggregate = {
+        "is_fake": fake_frames >= len(top),
+        "confidence": sum(top) / len(top),
+        "api_name": scored[0]["api_name"],
+        "details": {
+            "frames_scored": len(scored),
+            "fake_frames": fake_frames,
+            "mean_confidence": round(sum(scores) / len(scores), 3),
+            "max_confidence": round(scores[0], 3),
+            "temporal_spread": round(scores[0] - scores[-1], 3)
+        }
+    }
+    if len(scored) < len(results):
+        aggregate["details"]["frames_without_score"] = len(results) - len(scored)
+    # Frames the detector failed on (not ones skipped on purpose) make the
+    # clip verdict partial, so it is kept out of the cache like any failure
+    failed = [result for result in results if result.get("error")]
+    if failed:
+        aggregate["error"] = f"{len(failed)} of {len(results)} frames failed: {failed[0]['error']}"
+    if latencies:
+        aggregate["latency_ms"] = round(sum(latencies) / len(latencies), 1)
+    return aggregate
+
+def aggregate_frames(frame_results):
+    """Per-detector clip results from a list of per-frame {detector key: result} dicts"""
+    keys = list(dict.fromkeys(key for results in frame_results for key in results))
+    return {
+        key: aggregate_detector([results[key] for results in frame_results if key in results])
+        for key in keys
+    }
@@ -0,0 +1,48 @@
+from powerhex_forensics import CLEAN_CONFIDENCE, MAX_CONFIDENCE
+from powerhex_fusion import LOCAL_DETECTOR_WEIGHTS, FusionPolicy
+
+REMOTE = ("deepware", "faceforensics")
+
+def results(**confidences):
+    return {key: {"confidence": confidence} for key, confidence in confidences.items()}
+
+def clean_local():
+    return {key: {"confidence": CLEAN_CONFIDENCE} for key in LOCAL_DETECTOR_WEIGHTS}
+
+def test_clean_local_results_keep_remote_verdicts():
+    policy = FusionPolicy()
+    for confidence in (0.1, 0.5, 0.65, 0.7, 0.85, 0.95):
+        remote = results(deepware=confidence, faceforensics=confidence)
+        verdict = policy.classify(policy.fuse(remote))
+        assert policy.classify(policy.fuse({**remote, **clean_local()})) == verdict
+        assert policy.decide({**remote, **clean_local()}, set()) == verdict
+
+def test_remote_verdicts_from_the_review():
+    policy = FusionPolicy()
+    assert policy.classify(policy.fuse({**results(deepware=0.85, faceforensics=0.85), **clean_local()})) == "LIKELY FAKE"
+    assert policy.classify(policy.fuse({**results(deepware=0.65, faceforensics=0.65), **clean_local()})) == "SUSPICIOUS"
+
+def test_local_evidence_raises_the_score():
+    policy = FusionPolicy()
+    remote = results(deepware=0.7, faceforensics=0.7)
+    assert policy.fuse({**remote, **results(ela=MAX_CONFIDENCE)}) > policy.fuse(remote)
+
+def test_clean_local_results_do_not_settle_a_scan():
+    assert FusionPolicy().decide(clean_local(), set(REMOTE)) is None
+
+def test_strong_local_evidence_ends_the_scan_early():
+    policy = FusionPolicy()
+    local = results(ela=MAX_CONFIDENCE, jpeg_history=MAX_CONFIDENCE, noise_spectrum=CLEAN_CONFIDENCE)
+    assert policy.decide(local, set(REMOTE)) == "LIKELY FAKE"
+
+def test_weaker_local_agreement_waits_for_the_remote_detectors():
+    policy = FusionPolicy()
+    assert policy.decide(results(ela=0.9, jpeg_history=0.9), set(REMOTE)) is None
+    assert policy.decide(results(ela=MAX_CONFIDENCE), set(REMOTE) | {"jpeg_history"}) is None
+
+def test_pending_local_detectors_keep_the_verdict_open():
+    # Two remotes at 0.82 fuse to LIKELY FAKE, but a local result at the
+    # minimum that still counts (0.6) would pull it below the threshold
+    policy = FusionPolicy()
+    assert policy.decide(results(deepware=0.82, faceforensics=0.82), {"ela"}) is None
+    assert policy.decide(results(deepware=0.95, faceforensics=0.95), {"ela"}) == "LIKELY FAKE"
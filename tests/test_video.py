@@ -0,0 +1,24 @@
+from powerhex_detectors import detector_error, detector_skipped
+from powerhex_pipeline import is_cacheable
+from powerhex_video import aggregate_detector
+
+def frame(confidence):
+    return {"is_fake": confidence > 0.5, "confidence": confidence, "api_name": "Deepware API", "details": {}}
+
+def test_clip_with_failed_frames_is_not_cacheable():
+    clip = aggregate_detector([frame(0.9), detector_error("Deepware API", "timed out"), frame(0.2)])
+    assert clip["confidence"] == 0.9
+    assert "timed out" in clip["error"]
+    assert not is_cacheable({"detectors": {"deepware": clip}})
+
+def test_clip_with_skipped_frames_is_cacheable():
+    clip = aggregate_detector([frame(0.9), detector_skipped("Deepware API", "verdict already decided")])
+    assert "error" not in clip
+    assert clip["details"]["frames_without_score"] == 1
+    assert is_cacheable({"detectors": {"deepware": clip}})
+
+def test_clip_without_scores_reports_the_failure():
+    clip = aggregate_detector([detector_skipped("Deepware API", "verdict already decided"),
+                               detector_error("Deepware API", "circuit open")])
+    assert clip["error"] == "circuit open"
+    assert not is_cacheable({"detectors": {"deepware": clip}})